@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import json
+import pytest
+import requests
+
+
+@pytest.fixture
+def make_response():
+    """Return a function to make a response, with content that is a string
+    or data (dumped to json).
+    """
+
+    def make_response(content, status_code=200, headers=None):
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        response.encoding = "utf-8"
+        response._content = content.encode("utf-8")
+        return response
+
+    return make_response
+
+
+@pytest.fixture
+def decision_cache(tmp_path, monkeypatch):
+    """An ORCID decision cache in a temporary directory"""
+    from tributors.main import orcid
+
+    cache = orcid.SearchCache(filename=str(tmp_path / "decisions.json"))
+    monkeypatch.setattr(orcid, "get_decision_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def search_cache(tmp_path, monkeypatch, decision_cache):
+    """An ORCID search cache (and decision cache) in a temporary directory"""
+    from tributors.main import orcid
+
+    cache = orcid.SearchCache(filename=str(tmp_path / "searches.json"))
+    monkeypatch.setattr(orcid, "get_search_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def orcid_results(make_response):
+    """Return a function to make an ORCID (expanded) search response"""
+
+    def orcid_results(results):
+        return make_response({"expanded-result": results})
+
+    return orcid_results
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import asyncio
+import os
+import time
+
+
+def test_async_resource_lookups(tmp_path):
+    """test that the async client returns lookups without touching disk"""
+    from tributors.main.aio import AsyncTributorsClient
+
+    cache = {
+        "vsoch": {"name": "Vanessasaurus", "email": "vsoch@users.noreply.github.com"},
+        "yarikoptic": {"name": "Yaroslav Halchenko", "orcid": "0000-0003-3456-2493"},
+    }
+    mailmap = tmp_path / ".mailmap"
+    mailmap.write_text("Joe Smith <joe.smith@gmail.com>\n")
+
+    client = AsyncTributorsClient(cache=cache)
+    params = {"--mailmap-file": str(mailmap)}
+    lookups = asyncio.run(client.get_resource_lookups(["tributors", "mailmap"], params))
+    assert lookups["login"] == {"vsoch", "yarikoptic"}
+    assert lookups["orcid"] == {"0000-0003-3456-2493"}
+    assert lookups["email"] == {
+        "vsoch@users.noreply.github.com",
+        "joe.smith@gmail.com",
+    }
+
+    # Updating the cache from a resource doesn't write .tributors
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        result = asyncio.run(client.update_resource(["mailmap"], params))
+    finally:
+        os.chdir(cwd)
+    assert result is client.cache
+    assert not (tmp_path / ".tributors").exists()
+
+
+def test_async_shared_metadata(monkeypatch):
+    """test that overlapping calls share repository metadata, and that it is
+    forgotten once no call uses it
+    """
+    from tributors.main import github
+    from tributors.main.aio import AsyncTributorsClient
+
+    calls = []
+
+    def get_repo(uid):
+        calls.append(uid)
+        time.sleep(0.1)
+        return {"full_name": uid}
+
+    monkeypatch.setattr(github, "get_repo", get_repo)
+    monkeypatch.setattr(github, "get_contributors", lambda uid, workers=1: {})
+
+    async def update():
+        clients = [AsyncTributorsClient(), AsyncTributorsClient()]
+        return await asyncio.gather(
+            *[
+                client.init(repo="con/tributors", from_resources=["tributors"])
+                for client in clients
+            ]
+        )
+
+    asyncio.run(update())
+    assert calls == ["con/tributors"]
+    assert not github.registry.results
+
+    # Metadata used outside of a call is kept
+    github.registry.do(("con/other", "repo"), dict, name="other")
+    asyncio.run(update())
+    assert list(github.registry.results) == [("con/other", "repo")]
+    github.registry.forget()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+
+def test_provenance_refresh():
+    """test that only a bounded number of the oldest expired entries refresh"""
+    from tributors.main.cache import (
+        PROVENANCE,
+        needs_update,
+        parse_ttl,
+        refresh,
+        revalidate,
+        set_field,
+    )
+
+    cache = {
+        "vsoch": set_field({}, "email", "vsoch@users.noreply.github.com", "github"),
+        "yarikoptic": set_field({}, "orcid", "0000-0003-3456-2493", "orcid"),
+        "manbat": {"name": "Manbat"},
+    }
+    cache["vsoch"][PROVENANCE]["email"]["updated"] = "2020-01-01T00:00:00+00:00"
+    cache["yarikoptic"][PROVENANCE]["orcid"]["updated"] = "2021-01-01T00:00:00+00:00"
+
+    # Nothing is refreshed unless asked, and hand edited fields never are
+    assert refresh(cache, 0) == []
+    assert refresh(cache, 1) == ["vsoch"]
+    assert needs_update(cache["vsoch"], "email")
+    assert not needs_update(cache["yarikoptic"], "orcid")
+
+    # A refreshed field without a value in its source is removed
+    assert revalidate(cache["vsoch"], "email", None, "github")
+    assert "email" not in cache["vsoch"] and PROVENANCE not in cache["vsoch"]
+
+    # Unless the search was inconclusive
+    ttl = parse_ttl(["orcid.orcid=10000"])
+    assert refresh(cache, 5, ttl) == []
+    assert refresh(cache, 5, parse_ttl(["orcid.*=1"])) == ["yarikoptic"]
+    assert revalidate(cache["yarikoptic"], "orcid", None, "orcid", remove=False)
+    assert cache["yarikoptic"]["orcid"] == "0000-0003-3456-2493"
+    assert not needs_update(cache["yarikoptic"], "orcid")
+
+
+def test_rolling_refresh():
+    """test that fields that are not refreshed don't hold back other entries"""
+    from tributors.main.cache import PROVENANCE, is_stale, refresh, set_field
+    from tributors.main.parsers.base import update_from_identifier
+
+    cache = {
+        "vsoch": set_field({}, "name", "Vanessa Sochat", "orcid"),
+        "yarikoptic": set_field({}, "name", "Yaroslav Halchenko", "orcid"),
+    }
+    cache["vsoch"][PROVENANCE]["name"]["updated"] = "2020-01-01T00:00:00+00:00"
+    cache["yarikoptic"][PROVENANCE]["name"]["updated"] = "2021-01-01T00:00:00+00:00"
+
+    # The first run marks vsoch, which isn't refreshed (its source didn't run)
+    assert refresh(cache, 1) == ["vsoch"]
+    assert refresh(cache, 1) == ["yarikoptic"]
+    assert refresh(cache, 1) == []
+    assert is_stale(cache["vsoch"], "name")
+
+    # A record refreshes a name, even if it is already set
+    class Record:
+        found = True
+        firstName = "Yaroslav"
+        lastName = "O. Halchenko"
+        affiliation = None
+
+    update_from_identifier(cache["yarikoptic"], "yarikoptic", Record())
+    assert cache["yarikoptic"]["name"] == "Yaroslav O. Halchenko"
+    assert not is_stale(cache["yarikoptic"], "name")
+
+
+def test_tributors_cache_indexes():
+    """test that the cache indexes follow entries as they change"""
+    from tributors.main.cache import set_field, unset_field, TributorsCache
+
+    cache = TributorsCache(
+        {
+            "vsoch": {
+                "name": "Vanessa Sochat",
+                "email": "vsoch@users.noreply.github.com",
+            },
+            "yarikoptic": {"name": "Yaroslav Halchenko"},
+        }
+    )
+    assert (
+        cache.get_by("email", "vsoch@users.noreply.github.com")["name"]
+        == "Vanessa Sochat"
+    )
+    assert list(cache.find("name", "  vanessa   SOCHAT")) == ["vsoch"]
+
+    # Changing an entry in place (as parsers do) updates the indexes
+    entry = cache["yarikoptic"]
+    set_field(entry, "orcid", "0000-0003-3456-2493", "orcid")
+    entry["name"] = "Yaroslav O. Halchenko"
+    assert cache.get_by("orcid", "0000-0003-3456-2493") is entry
+    assert not cache.find("name", "Yaroslav Halchenko")
+    unset_field(entry, "orcid")
+    assert cache.get_by("orcid", "0000-0003-3456-2493") is None
+
+    # Replacing or removing entries does too
+    cache["vsoch"] = {"email": "vsoch@example.com"}
+    assert cache.get_by("email", "vsoch@users.noreply.github.com") is None
+    assert cache.unique("email") == {"vsoch@example.com"}
+    del cache["vsoch"]
+    assert cache.unique("email") == set()
+    assert cache.unique("name") == {"Yaroslav O. Halchenko"}
+    assert isinstance(cache, dict) and list(cache) == ["yarikoptic"]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import json
+import pytest
+
+
+def test_contributor():
+    """test that a contributor keeps only the fields we use, and can be read
+    like the GitHub response it replaces
+    """
+    from tributors.main.contributor import Contributor
+
+    data = {
+        "login": "vsoch",
+        "id": 814322,
+        "node_id": "MDQ6VXNlcjgxNDMyMg==",
+        "type": "User",
+        "contributions": 42,
+        "html_url": "https://github.com/vsoch",
+        "avatar_url": "https://avatars.githubusercontent.com/u/814322?v=4",
+        "site_admin": False,
+    }
+    person = Contributor.from_github(data)
+    assert not hasattr(person, "__dict__")
+    assert person["type"] == "User" and person["contributions"] == 42
+    assert person.get("name") is None and "name" not in person
+    assert person.get("id", "missing") == "missing"
+    with pytest.raises(KeyError):
+        person["email"]
+
+    # Strings repeated across contributors are shared
+    other = Contributor.from_github(dict(data, login="yarikoptic"))
+    assert other.type is person.type
+
+    # Fields from the cache are added to those from GitHub
+    entry = {"name": "Vanessa Sochat", "orcid": "0000-0002-4387-3819"}
+    person = Contributor.from_cache("vsoch", entry).fill(person)
+    assert person.to_allcontrib("code") == {
+        "login": "vsoch",
+        "name": "Vanessa Sochat",
+        "contributions": ["code"],
+        "profile": "https://github.com/vsoch",
+        "avatar_url": "https://avatars.githubusercontent.com/u/814322?v=4",
+    }
+    assert person.to_zenodo() == {
+        "name": "Vanessa Sochat",
+        "orcid": "0000-0002-4387-3819",
+    }
+    codemeta = person.to_codemeta()
+    assert codemeta["familyName"] == "Sochat"
+    assert Contributor.from_codemeta(codemeta).orcid == "0000-0002-4387-3819"
+    assert Contributor.from_zenodo(person.to_zenodo()).name == "Vanessa Sochat"
+
+
+def test_contributor_list():
+    """test that a contributor list keeps its indexes as entries change"""
+    from tributors.main.contributor import ContributorList
+    from tributors.main.parsers.codemeta import get_orcid
+
+    keys = {"email": "email", "orcid": get_orcid}
+    creators = ContributorList(
+        [{"@type": "Person", "email": "vsoch@example.com"}], keys=keys
+    )
+    entry = {"@type": "Person", "@id": "https://orcid.org/0000-0002-4387-3819"}
+    creators.append(entry)
+    assert creators.lookup("orcid")["0000-0002-4387-3819"] is entry
+    assert dict(entry) in creators and {"@type": "Person"} not in creators
+    assert set(creators.lookup("email")) == {"vsoch@example.com"}
+
+    # An entry changed in place is reindexed, and removal updates indexes
+    entry["email"] = "sochat1@llnl.gov"
+    creators.reindex(entry)
+    assert creators.find("email", "sochat1@llnl.gov") is entry
+    creators.remove(entry)
+    assert "0000-0002-4387-3819" not in creators.lookup("orcid")
+    assert len(creators.lookup("email")) == 1
+
+    # A lookup stays current as the list is rebuilt
+    emails = creators.lookup("email")
+    removed = creators.pop()
+    assert "vsoch@example.com" not in emails and len(emails) == 0
+    creators.append(entry)
+    assert emails["sochat1@llnl.gov"] is entry
+    creators.insert(0, removed)
+    assert set(emails) == {"vsoch@example.com", "sochat1@llnl.gov"}
+
+    # The list is still a list, and written as a list
+    assert creators.index(creators[-1]) == len(creators) - 1
+    assert json.loads(json.dumps(creators)) == list(creators)
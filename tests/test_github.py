@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from urllib.parse import parse_qs, urlparse
+import os
+
+
+def test_get_contributors_pages(monkeypatch, make_response):
+    """test that pages after the first are found from the Link header"""
+    from tributors.main import github
+
+    url = "https://api.github.com/repos/con/tributors/contributors"
+    requested = []
+
+    def get(paginated_url, **kwargs):
+        page = int(parse_qs(urlparse(paginated_url).query)["page"][0])
+        requested.append(page)
+        logins = [{"login": "user-%s-%s" % (page, i)} for i in range(2)]
+        link = '<%s?per_page=100&page=3>; rel="last"' % url
+        return make_response(logins, headers={"Link": link})
+
+    monkeypatch.setattr(github.http, "get", get)
+    contributors = github.get_contributors("con/tributors", workers=2)
+    assert sorted(requested) == [1, 2, 3]
+    assert list(contributors) == [
+        "user-%s-%s" % (page, i) for page in range(1, 4) for i in range(2)
+    ]
+
+
+def test_get_users_graphql(monkeypatch, make_response):
+    """test that a GraphQL batch is mapped back to logins, with REST fallback"""
+    from tributors.main import github
+
+    def post(url, json=None, **kwargs):
+        assert 'u0: user(login: "vsoch")' in json["query"]
+        data = {
+            "u0": {
+                "login": "vsoch",
+                "name": "Vanessasaurus",
+                "email": "",
+                "bio": "I'm the Vanessasaurus!",
+                "websiteUrl": "https://vsoch.github.io",
+            },
+            "u1": None,
+        }
+        return make_response({"data": data})
+
+    monkeypatch.setenv("GITHUB_TOKEN", "xxxxxxxx")
+    monkeypatch.setattr(github.http, "post", post)
+    monkeypatch.setattr(github, "get_user", lambda login: {"login": login})
+    users = github.get_users(["vsoch", "ghost"])
+    assert users[0]["blog"] == "https://vsoch.github.io"
+    assert users[1] == {"login": "ghost"}
+
+
+def test_sync_state(tmp_path, monkeypatch):
+    """test that incremental sync only selects new or stale contributors"""
+    from tributors.main.github import SyncState
+    import time
+
+    monkeypatch.setenv("TRIBUTORS_CACHE_DIR", str(tmp_path / "cache"))
+    cache_file = str(tmp_path / ".tributors")
+    cache = {
+        "vsoch": {"name": "Vanessasaurus", "blog": "https://vsoch.github.io"},
+        "yarikoptic": {
+            "name": "Yaroslav Halchenko",
+            "email": "a",
+            "bio": "b",
+            "blog": "c",
+        },
+    }
+    logins = ["vsoch", "yarikoptic", "manbat"]
+
+    state = SyncState("con/tributors", cache_file)
+    assert state.select(logins, cache, max_age=30) == ["vsoch", "manbat"]
+    for login in ["vsoch", "manbat"]:
+        state.fetched(login)
+    state.save(logins)
+    assert os.path.exists(state.filename) and os.listdir(tmp_path) == ["cache"]
+
+    # On the next run nothing is new or stale
+    state = SyncState("con/tributors", cache_file)
+    cache["manbat"] = {"name": "manbat"}
+    assert state.select(logins, cache, max_age=30) == []
+    assert state.select(logins + ["new"], cache, max_age=30) == ["new"]
+
+    # Unless the entries are older than the max age
+    state.data["fetched"]["vsoch"] = time.time() - 2 * 86400
+    assert state.select(logins, cache, max_age=1) == ["vsoch"]
+
+    # The state of another repository is kept separately
+    assert SyncState("con/other", cache_file).data == {"fetched": {}}
+
+
+def test_update_lookup_sources(tmp_path, monkeypatch):
+    """test that GitHub only refreshes (or removes) fields it provided"""
+    from tributors.main import github
+    from tributors.main.cache import PROVENANCE, TributorsCache, set_field
+    from tributors.main.contributor import Contributor
+
+    monkeypatch.setenv("TRIBUTORS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(github, "get_users", lambda logins, workers: [{"login": "x"}])
+    entry = set_field({}, "name", "Vanessa Sochat", "orcid")
+    set_field(entry, "email", "vsoch@example.com", "codemeta")
+    set_field(entry, "blog", "https://vsoch.github.io", "github")
+    for meta in entry[PROVENANCE].values():
+        meta["stale"] = True
+
+    repo = github.GitHubRepository("con/tributors")
+    repo._contributors = {"vsoch": Contributor("vsoch", type="User")}
+    repo.cache = TributorsCache({"vsoch": entry})
+    entry = repo.update_lookup()["vsoch"]
+    assert entry["name"] == "Vanessa Sochat"
+    assert entry["email"] == "vsoch@example.com"
+    assert entry[PROVENANCE]["email"]["stale"]
+    assert "blog" not in entry
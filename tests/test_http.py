@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import os
+
+
+def test_response_cache(tmp_path, make_response):
+    """test that a stored response is revalidated and served on 304"""
+    from tributors.main.http import ResponseCache
+
+    cache = ResponseCache(cache_dir=str(tmp_path), authenticated=True)
+    url = "https://api.github.com/users/vsoch"
+    headers = {"Authorization": "token one"}
+    assert cache.load(url, headers) is None
+
+    response = make_response('{"login": "vsoch"}', headers={"ETag": '"abc"'})
+    cache.save(url, headers, response)
+    entry = cache.load(url, headers)
+    assert cache.validators(entry) == {"If-None-Match": '"abc"'}
+
+    # A different token is a different identity
+    assert cache.load(url, {"Authorization": "token two"}) is None
+
+    # A 304 is turned back into the original response
+    cached = cache.response(entry, make_response("", status_code=304))
+    assert cached.status_code == 200
+    assert cached.json() == {"login": "vsoch"}
+    assert cached.headers["ETag"] == '"abc"'
+
+    # Responses without validators are not stored
+    cache.save(url, {}, make_response("{}"))
+    assert cache.load(url, {}) is None
+
+    # The cache is private, and by default authenticated responses aren't kept
+    mode = os.stat(cache.get_path(url, headers)).st_mode
+    assert mode & 0o777 == 0o600 and os.stat(tmp_path).st_mode & 0o777 == 0o700
+    cache = ResponseCache(cache_dir=str(tmp_path / "public"))
+    cache.save(url, headers, response)
+    assert cache.load(url, headers) is None and not os.listdir(cache.cache_dir)
+    cache.save(url, {}, response)
+    assert cache.load(url, {})
+
+
+def test_response_cache_eviction(tmp_path, make_response):
+    """test that least recently used entries are evicted first"""
+    from tributors.main.http import ResponseCache
+
+    cache = ResponseCache(cache_dir=str(tmp_path), max_size=600)
+    urls = ["https://api.github.com/users/%s" % i for i in range(4)]
+    for i, url in enumerate(urls):
+        response = make_response('{"bio": "%s"}' % ("x" * 100), headers={"ETag": "1"})
+        cache.save(url, {}, response)
+        os.utime(cache.get_path(url, {}), (i, i))
+    cache.save(urls[0], {}, make_response('{"bio": "y"}', headers={"ETag": "2"}))
+    assert cache.size <= 600
+    assert cache.load(urls[0], {})
+    assert cache.load(urls[1], {}) is None
+
+
+def test_rate_limit_scheduler(make_response):
+    """test backoff decisions for rate limits and server errors"""
+    from tributors.main.http import RateLimitScheduler
+    from email.utils import formatdate
+    import time
+
+    scheduler = RateLimitScheduler(retries=2)
+    reset = str(int(time.time()) + 30)
+    response = make_response(
+        "{}",
+        status_code=403,
+        headers={
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": reset,
+        },
+    )
+    scheduler.update("api.github.com", response, "core")
+    assert scheduler.remaining("api.github.com", "core")["remaining"] == 0
+    assert 25 < scheduler.backoff(response, 0) <= 31
+
+    # Each resource has its own budget, the response says which it is
+    response.headers["X-RateLimit-Resource"] = "search"
+    response.headers["X-RateLimit-Remaining"] = "29"
+    scheduler.update("api.github.com", response, "core")
+    assert scheduler.remaining("api.github.com", "search")["remaining"] == 29
+    assert scheduler.remaining("api.github.com", "core")["remaining"] == 0
+    assert scheduler.remaining("api.github.com", "graphql") is None
+
+    # Retry-After takes precedence, in seconds or as a date
+    response = make_response("{}", status_code=429, headers={"Retry-After": "3"})
+    assert scheduler.backoff(response, 0) == 3
+    date = formatdate(time.time() + 60, usegmt=True)
+    response = make_response("{}", status_code=503, headers={"Retry-After": date})
+    assert 55 < scheduler.backoff(response, 0) <= 60
+
+    # Secondary rate limits wait at least half a minute (with jitter)
+    response = make_response(
+        '{"message": "You have exceeded a secondary rate limit"}', status_code=403
+    )
+    assert scheduler.backoff(response, 0) >= 30
+
+    # Server errors back off, other errors are not retried
+    assert scheduler.backoff(make_response("{}", status_code=502), 1) <= 2
+    assert scheduler.backoff(make_response("{}", status_code=404), 0) is None
+    assert scheduler.backoff(make_response("{}", status_code=403), 0) is None
+
+
+def test_token_bucket(monkeypatch):
+    """test that a token bucket allows a burst, and then paces requests"""
+    from tributors.main import http
+
+    clock = [100.0]
+    sleeps = []
+
+    def sleep(delay):
+        sleeps.append(delay)
+        clock[0] += delay
+
+    monkeypatch.setattr(http.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(http.time, "sleep", sleep)
+
+    bucket = http.TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert not sleeps
+    bucket.acquire()
+    assert sleeps == [0.5]
+
+    # After a pause, the bucket refills up to the burst
+    clock[0] += 10
+    for _ in range(3):
+        bucket.acquire()
+    assert sleeps == [0.5]
@@ -42,3 +42,309 @@ def test_queries(tmp_path):
     # Test find by other-names (can't do because more than one result)
     result = get_orcid(email=None, name="Chris Gorgolewski")
     assert result == "0000-0003-3321-7583"
+
+
+def test_search_cache(monkeypatch, search_cache, orcid_results):
+    """test that search outcomes (including no result) are not searched again
+    """
+    from tributors.main import orcid
+
+    requests = []
+
+    def get(url, **kwargs):
+        requests.append(url)
+        if "Zumbudda" in url:
+            return orcid_results([])
+        return orcid_results([{"orcid-id": "0000-0003-3456-2493"}])
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    counts = []
+    for _ in range(2):
+        assert orcid.get_orcid(email="debian@onerussian.com") == "0000-0003-3456-2493"
+        assert not orcid.get_orcid(email=None, name="Zumbudda Zumbudda")
+        counts.append(len(requests))
+    assert counts[0] == counts[1] == 4
+
+    # The outcomes are persisted (when saved), and keyed by the normalized query
+    orcid.save_caches()
+    cache = orcid.SearchCache(filename=search_cache.filename)
+    url = orcid.extended_search_url("email:%s", "DEBIAN@onerussian.com")
+    assert cache.get(url)["orcid"] == "0000-0003-3456-2493"
+
+
+def test_identifier_sections(monkeypatch, make_response):
+    """test that only the needed sections of a record are retrieved, once
+    """
+    from tributors.main import orcid
+
+    requests = []
+    sections = {
+        "person": {
+            "name": {
+                "given-names": {"value": "Yaroslav"},
+                "family-name": {"value": "Halchenko"},
+            }
+        },
+        "employments": {
+            "affiliation-group": [
+                {
+                    "summaries": [
+                        {
+                            "employment-summary": {
+                                "organization": {"name": "Dartmouth College"}
+                            }
+                        }
+                    ]
+                }
+            ]
+        },
+    }
+
+    def get(url, **kwargs):
+        requests.append(url)
+        return make_response(sections[url.rsplit("/", 1)[-1]])
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    monkeypatch.setattr(orcid, "sections", orcid.SingleFlight())
+    for _ in range(2):
+        cli = orcid.OrcidIdentifier("0000-0003-3456-2493")
+        assert cli.found
+        assert cli.firstName == "Yaroslav" and cli.lastName == "Halchenko"
+        assert cli.affiliation == "Dartmouth College"
+    assert requests == [
+        "https://pub.orcid.org/v3.0/0000-0003-3456-2493/person",
+        "https://pub.orcid.org/v3.0/0000-0003-3456-2493/employments",
+    ]
+
+
+def test_prefetch_emails(monkeypatch, search_cache, orcid_results):
+    """test that emails are searched in batches, and demultiplexed
+    """
+    from tributors.main import orcid
+
+    monkeypatch.setattr(orcid, "EMAIL_BATCH_SIZE", 2)
+
+    requests = []
+    people = {
+        "debian@onerussian.com": ["0000-0003-3456-2493"],
+        "twins@example.com": ["0000-0001-0000-0001", "0000-0001-0000-0002"],
+    }
+
+    def get(url, **kwargs):
+        requests.append(url)
+        return orcid_results(
+            [
+                {"orcid-id": orcid_id, "email": [email.upper()]}
+                for email, orcids in people.items()
+                for orcid_id in orcids
+                if email.replace("@", "%40") in url
+            ]
+        )
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    emails = ["debian@onerussian.com", "twins@example.com", "nobody@example.com"]
+    orcid.prefetch_emails(emails + [None])
+    assert len(requests) == 2 and "+OR+" in requests[0]
+
+    # Found and missing emails are cached, ambiguous are left for a single search
+    def lookup(email):
+        return search_cache.get(orcid.extended_search_url("email:%s", email))
+
+    assert lookup("debian@onerussian.com")["orcid"] == "0000-0003-3456-2493"
+    assert lookup("nobody@example.com")["outcome"] == "none"
+    assert lookup("twins@example.com") is None
+    assert orcid.get_orcid(email="debian@onerussian.com") == "0000-0003-3456-2493"
+    assert len(requests) == 2
+
+
+def test_speculative_search(monkeypatch, search_cache, orcid_results):
+    """test that speculative searches keep the order of preference
+    """
+    import threading
+    from tributors.main import orcid
+
+    requests = []
+    started = threading.Barrier(2, timeout=5)
+
+    def get(url, **kwargs):
+        requests.append(url)
+        # The email search only returns once the name search has started
+        if "email" in url:
+            started.wait()
+            return orcid_results([])
+        if "credit-name" in url:
+            started.wait()
+        return orcid_results([{"orcid-id": "0000-0003-3456-2493"}])
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    result = orcid.get_orcid(
+        email="yoh@example.com", name="Yaroslav Halchenko", speculative=True
+    )
+    assert result == "0000-0003-3456-2493"
+    assert "email" in requests[0] or "email" in requests[1]
+    key = orcid.extended_search_url("email:%s", "yoh@example.com")
+    assert search_cache.get(key)["outcome"] == "none"
+
+
+def test_speculative_cancelled(monkeypatch, search_cache, orcid_results):
+    """test that speculative searches after an answer are not sent
+    """
+    import time
+    from tributors.main import orcid
+
+    requests = []
+
+    def get(url, **kwargs):
+        requests.append(url)
+        if "email" in url:
+            return orcid_results([{"orcid-id": "0000-0003-3456-2493"}])
+        time.sleep(0.1)
+        return orcid_results([])
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    name = "Yaroslav O Halchenko"
+    result = orcid.get_orcid(email="yoh@example.com", name=name, speculative=True)
+    assert result == "0000-0003-3456-2493"
+
+    # The searches are run two at a time, so the last one never started
+    time.sleep(0.3)
+    searches = list(orcid.gen_searches("yoh@example.com", name))
+    last = orcid.extended_search_url(*searches[-1][0])
+    assert len(searches) == 5 and len(requests) <= 3 and last not in requests
+
+
+def test_throttled_search(monkeypatch, search_cache, make_response):
+    """test that a throttled search is not taken to mean no result
+    """
+    from tributors.main import orcid
+
+    requests_made = []
+
+    def get(url, **kwargs):
+        requests_made.append(url)
+        response = make_response("", status_code=503)
+        response.url = url
+        return response
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    monkeypatch.setattr(orcid, "sections", orcid.SingleFlight())
+    assert not orcid.get_orcid(email="yoh@example.com", name="Yaroslav Halchenko")
+
+    # We stop at the first search, and don't remember the outcome
+    assert len(requests_made) == 1
+    assert not search_cache.data
+
+    # A record that can't be retrieved now is tried again later
+    cli = orcid.OrcidIdentifier("0000-0003-3456-2493")
+    assert not cli.found and not cli.found
+    assert len(requests_made) == 3
+
+
+def test_interactive_decisions(
+    monkeypatch, search_cache, decision_cache, orcid_results
+):
+    """test that interactive decisions are kept, and candidates prefetched
+    """
+    from tributors.main import orcid
+
+    requests = []
+    prompts = []
+
+    def get(url, **kwargs):
+        requests.append(url)
+        return orcid_results(
+            [
+                {
+                    "orcid-id": "0000-0001-0000-000%s" % i,
+                    "given-names": "Yaroslav",
+                    "family-names": "Halchenko",
+                    "institution-name": [],
+                    "other-name": [],
+                    "email": [],
+                }
+                for i in range(2)
+            ]
+        )
+
+    def choice_prompt(*args, **kwargs):
+        prompts.append(args)
+        return "2"
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    monkeypatch.setattr(orcid, "choice_prompt", choice_prompt)
+
+    # The candidates are prefetched, and the prompt doesn't search again
+    people = [("yoh@example.com", None, None)]
+    orcid.prefetch_candidates(people).shutdown(wait=True)
+    assert len(requests) == 1
+    result = orcid.get_orcid("yoh@example.com", interactive=True)
+    assert result == "0000-0001-0000-0001"
+    assert len(requests) == 1 and len(prompts) == 1
+
+    # The decision is saved, and used from now on, with or without prompts
+    orcid.save_caches()
+    decisions = orcid.SearchCache(filename=decision_cache.filename)
+    monkeypatch.setattr(orcid, "get_decision_cache", lambda: decisions)
+    for interactive in [True, False]:
+        assert orcid.get_orcid("yoh@example.com", interactive=interactive) == result
+    assert len(requests) == 1 and len(prompts) == 1
+    assert "chosen" not in [x["outcome"] for x in search_cache.data.values()]
+
+    # But only for that person, and not others with the same name
+    name = "Yaroslav Halchenko"
+    assert orcid.get_orcid(None, name, interactive=True, person="yarikoptic")
+    assert not orcid.get_orcid(None, name, person="someone-else")
+    assert orcid.get_orcid(None, name, person="yarikoptic") == result
+    assert len(prompts) == 2
+
+
+def test_review_orcids(monkeypatch, search_cache, orcid_results):
+    """test that ambiguous people are reviewed together, and decisions kept
+    """
+    import requests
+    from tributors.main import orcid
+
+    def candidates(count):
+        return orcid_results(
+            [
+                {
+                    "orcid-id": "0000-0001-0000-000%s" % i,
+                    "given-names": "Yaroslav",
+                    "family-names": "Halchenko",
+                    "institution-name": ["Dartmouth College"],
+                    "other-name": [],
+                    "email": [],
+                }
+                for i in range(count)
+            ]
+        )
+
+    reviews = []
+
+    def review_prompt(items, regex=None):
+        reviews.append(items)
+        return [("choose", 1), ("skip", None)]
+
+    monkeypatch.setattr(orcid.http, "get", lambda url, **kwargs: candidates(3))
+    monkeypatch.setattr(orcid, "review_prompt", review_prompt)
+    people = [("yoh@example.com", None, None), ("other@example.com", None, None)]
+    result = orcid.review_orcids(people, workers=2)
+    assert result == ["0000-0001-0000-0001", None]
+    assert len(reviews) == 1 and len(reviews[0][0]["options"]) == 3
+    assert "Dartmouth College" in reviews[0][0]["options"][0]
+
+    # Both decisions are kept, so there is nothing left to review
+    assert orcid.review_orcids(people) == [None, None]
+    assert len(reviews) == 1
+    assert orcid.get_orcid("yoh@example.com") == "0000-0001-0000-0001"
+
+    # A search that fails doesn't stop the review of everyone else
+    def get(url, **kwargs):
+        if "failed" in url:
+            raise requests.ConnectionError("Connection refused")
+        return candidates(2)
+
+    monkeypatch.setattr(orcid.http, "get", get)
+    people = [("failed@example.com", None, None), ("new@example.com", None, None)]
+    assert orcid.review_orcids(people, workers=2) == [None, "0000-0001-0000-0001"]
+    assert len(reviews) == 2 and len(reviews[1]) == 1
@@ -146,3 +146,41 @@ def test_parser_zenodo(tmp_path):
         from_resources={"orcid": set(["0000-0000-0000-0000"])}, save=False
     )
     assert len(byorcid["creators"]) == 4
+
+
+def test_update_cache_parallel(monkeypatch):
+    """test that orcid ids are resolved in parallel, in order, for the cache"""
+    import tributors.main.parsers.base as base
+    from tributors.main.parsers.base import ParserBase
+
+    class Identifier:
+        def __init__(self, orcid):
+            self.found = True
+            self.firstName, self.lastName = "Vanessa", "Sochat"
+            self.affiliation = "Stanford"
+
+        def get_record(self):
+            pass
+
+    emails = {"vsoch@users.noreply.github.com": "0000-0002-4387-3819"}
+    monkeypatch.setattr(base, "OrcidIdentifier", Identifier)
+    monkeypatch.setattr(base, "prefetch_emails", lambda emails: None)
+    monkeypatch.setattr(
+        base, "get_orcid", lambda email, name, **kwargs: emails.get(email)
+    )
+
+    parser = ParserBase(params={"--workers": 4})
+    parser.cache = {
+        "vsoch": {"email": "vsoch@users.noreply.github.com"},
+        "manbat": {"email": "manbat@users.noreply.github.com"},
+        "yarikoptic": {"orcid": "0000-0003-3456-2493", "name": "Yaroslav"},
+    }
+    parser.update_cache(update_lookup=False)
+    assert parser.cache["vsoch"]["orcid"] == "0000-0002-4387-3819"
+    assert parser.cache["vsoch"]["name"] == "Vanessa Sochat"
+    assert parser.cache["vsoch"]["affiliation"] == "Stanford"
+    assert "orcid" not in parser.cache["manbat"]
+    assert parser.cache["yarikoptic"] == {
+        "orcid": "0000-0003-3456-2493",
+        "name": "Yaroslav",
+    }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import os
+import sqlite3
+
+
+def test_sqlite_store(tmp_path):
+    """test that the sqlite store keeps entries, and saves only changes"""
+    from tributors.main.store import get_store, SqliteStore
+
+    database = str(tmp_path / ".tributors.db")
+    store = get_store(database)
+    assert isinstance(store, SqliteStore)
+    assert store.load() == {}
+
+    cache = {
+        "vsoch": {"name": "Vanessa  Sochat", "email": "vsoch@users.noreply.github.com"},
+        "yarikoptic": {"name": "Yaroslav Halchenko", "orcid": "0000-0003-3456-2493"},
+    }
+    store.save(cache)
+
+    # Reloading keeps the order, and only changed entries are written
+    store = get_store(database)
+    cache = store.load()
+    assert list(cache) == ["vsoch", "yarikoptic"]
+    cache["vsoch"]["orcid"] = "0000-0002-4387-3819"
+    del cache["yarikoptic"]
+    statements = []
+    connect = store.connect
+
+    def traced():
+        connection = connect()
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    store.connect = traced
+    store.save(cache)
+    writes = [x for x in statements if x.startswith(("INSERT", "DELETE"))]
+    assert len(writes) == 2
+    assert get_store(database).load() == cache
+
+    # Nothing changed, nothing written
+    statements.clear()
+    store.save(cache)
+    assert not statements
+
+
+def test_store_json(tmp_path):
+    """test import and export of the cache as json"""
+    from tributors.main.store import get_store
+    from tributors.utils.file import read_json, write_json
+
+    exported = str(tmp_path / "exported.json")
+    write_json({"vsoch": {"name": "Vanessa Sochat"}}, str(tmp_path / ".tributors"))
+    get_store(str(tmp_path / ".tributors")).export_json(exported)
+
+    store = get_store(str(tmp_path / ".tributors.db"))
+    assert store.import_json(exported) == {"vsoch": {"name": "Vanessa Sochat"}}
+    store.export_json(str(tmp_path / "roundtrip.json"))
+    assert read_json(str(tmp_path / "roundtrip.json")) == read_json(exported)
+    connection = sqlite3.connect(str(tmp_path / ".tributors.db"))
+    assert connection.execute("SELECT count(*) FROM contributors").fetchone() == (1,)
+
+
+def test_json_store_unchanged(tmp_path):
+    """test that an unchanged cache (or file) is not written again"""
+    from tributors.main.cache import set_field, TributorsCache
+    from tributors.main.store import get_store
+    from tributors.utils.file import write_json
+
+    filename = str(tmp_path / ".tributors")
+    write_json({"vsoch": {"name": "Vanessa Sochat"}}, filename)
+    os.utime(filename, (0, 0))
+
+    store = get_store(filename)
+    cache = TributorsCache(store.load())
+    store.save(cache, changed=cache.dirty)
+    write_json({"vsoch": {"name": "Vanessa Sochat"}}, filename)
+    assert os.stat(filename).st_mtime == 0
+
+    # A change is written (atomically, without leaving a temporary file)
+    set_field(cache["vsoch"], "email", "vsoch@users.noreply.github.com", "github")
+    assert cache.dirty == {"vsoch"}
+    store.save(cache, changed=cache.dirty)
+    assert os.stat(filename).st_mtime > 0
+    assert store.load()["vsoch"]["email"] == "vsoch@users.noreply.github.com"
+    assert os.listdir(str(tmp_path)) == [".tributors"]
+
+
+def test_journal_recovery(tmp_path):
+    """test that changes of an interrupted run are recovered from the journal"""
+    from tributors.main import TributorsClient
+    from tributors.main.cache import set_field
+    from tributors.utils.file import read_json, write_json
+
+    cwd = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        write_json({"vsoch": {"name": "Vanessa Sochat"}}, ".tributors")
+        client = TributorsClient()
+        set_field(client.cache["vsoch"], "email", "vsoch@example.com", "github")
+        client.cache["yarikoptic"] = {"name": "Yaroslav Halchenko"}
+        del client.cache["yarikoptic"]["name"]
+        assert os.path.exists(".tributors.journal")
+
+        # The run exits before saving, and a partial line is left behind
+        with open(".tributors.journal", "a") as filey:
+            filey.write('{"login": "vs')
+        client = TributorsClient()
+        assert client.cache["vsoch"]["email"] == "vsoch@example.com"
+        assert client.cache["yarikoptic"] == {}
+
+        # A save compacts the journal into the cache
+        client.save_cache()
+        assert not os.path.exists(".tributors.journal")
+        assert read_json(".tributors")["vsoch"]["email"] == "vsoch@example.com"
+
+        # Changes for another version of the cache (e.g., after a pull) are
+        # discarded, and removing a field that isn't there isn't a change
+        client.cache["vsoch"].pop("orcid", None)
+        assert not client.cache.dirty
+        set_field(client.cache["vsoch"], "orcid", "0000-0002-4387-3819", "orcid")
+        write_json({"vsoch": {"name": "Vanessa"}, "manbat": {}}, ".tributors")
+        client = TributorsClient()
+        assert "orcid" not in client.cache["vsoch"]
+        assert not os.path.exists(".tributors.journal")
+    finally:
+        os.chdir(cwd)
+
+
+def test_identity_cache(tmp_path, monkeypatch):
+    """test that people are shared between repositories in the identity cache"""
+    from tributors.main import TributorsClient
+    from tributors.main.cache import PROVENANCE, set_field, unset_field
+    from tributors.utils.file import read_json
+
+    monkeypatch.setenv("TRIBUTORS_CACHE_DIR", str(tmp_path / "cache"))
+    cwd = os.getcwd()
+    for repo in ["one", "two"]:
+        os.makedirs(str(tmp_path / repo))
+    try:
+        os.chdir(str(tmp_path / "one"))
+        client = TributorsClient(global_cache=True)
+        entry = set_field({}, "name", "Vanessa Sochat", "github")
+        client.cache["vsoch"] = set_field(
+            entry, "orcid", "0000-0002-4387-3819", "orcid"
+        )
+        client.cache["yarikoptic"] = {"email": "debian@onerussian.com"}
+        client.save_cache()
+
+        # Another repository finds the person by login, and then by email
+        os.chdir(str(tmp_path / "two"))
+        client = TributorsClient(global_cache=True)
+        client.cache["yoh"] = {"email": "debian@onerussian.com"}
+        assert client.cache.recall(["vsoch", "yoh"], source="github") == {"vsoch"}
+        assert client.cache["vsoch"]["orcid"] == "0000-0002-4387-3819"
+        assert client.cache["vsoch"][PROVENANCE]["orcid"]["source"] == "orcid"
+        assert client.cache.get_by("email", "debian@onerussian.com") is not None
+
+        # The newest value of a field is kept when both repositories save
+        set_field(client.cache["vsoch"], "name", "V. Sochat", "github")
+        client.save_cache()
+        assert "vsoch" in read_json(".tributors")
+        shared = client.cache.identities.recall([("vsoch", None, None)])["vsoch"]
+        assert shared["name"] == "V. Sochat"
+        assert client.cache.identities.merge(client.cache) == 0
+
+        # A field removed in one repository is not brought back
+        unset_field(client.cache["vsoch"], "orcid")
+        client.save_cache()
+        client = TributorsClient(global_cache=True)
+        assert client.cache.recall(["vsoch"]) == {"vsoch"}
+        assert "orcid" not in client.cache["vsoch"]
+        os.chdir(str(tmp_path / "one"))
+        client = TributorsClient(global_cache=True)
+        client.save_cache()
+        assert client.cache.recall(["new"]) == set()
+        shared = client.cache.identities.recall([("vsoch", None, None)])["vsoch"]
+        assert "orcid" not in shared and shared[PROVENANCE]["orcid"]["deleted"]
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+
+Copyright (C) 2020 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+import pytest
+import time
+
+
+def test_parallel_map_order():
+    """test that results are returned in the order of the items"""
+    from tributors.utils.threads import parallel_map
+
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x))
+        return x * x
+
+    items = list(range(5))
+    expected = [x * x for x in items]
+    assert parallel_map(slow_square, items, workers=1) == expected
+    assert parallel_map(slow_square, items, workers=4) == expected
+    assert parallel_map(slow_square, [], workers=4) == []
+
+
+def test_single_flight():
+    """test that concurrent calls for the same key run the function once"""
+    from tributors.utils.threads import parallel_map, SingleFlight
+
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return key.upper()
+
+    flight = SingleFlight()
+    results = parallel_map(lambda _: flight.do("repo", fetch, "repo"), range(8), 8)
+    assert results == ["REPO"] * 8
+    assert flight.do("repo", fetch, "repo") == "REPO"
+    assert calls == ["repo"]
+
+    # Failures are raised, and the key can be tried again
+    def fail():
+        raise ValueError("no repo")
+
+    with pytest.raises(ValueError):
+        flight.do("other", fail)
+    assert flight.do("other", fetch, "other") == "OTHER"
+
+    # As are lookups that return nothing
+    assert flight.do("missing", lambda: None) is None
+    assert flight.do("missing", fetch, "missing") == "MISSING"
+
+    # With a ttl, results are only kept until they expire
+    flight = SingleFlight(ttl=0.05)
+    flight.do("repo", fetch, "repo")
+    flight.do("repo", fetch, "repo")
+    time.sleep(0.06)
+    flight.do("repo", fetch, "repo")
+    assert calls.count("repo") == 3
+
+
+def test_single_flight_scope():
+    """test that results are forgotten when the last scope using them ends"""
+    from tributors.utils.threads import parallel_map, scope, SingleFlight
+
+    flight = SingleFlight()
+    with scope():
+        parallel_map(lambda x: flight.do(x, str, x), [1, 2], workers=2)
+        with scope():
+            flight.do(2, str, 2)
+        assert set(flight.results) == {1, 2}
+    assert not flight.results
@@ -11,6 +11,7 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 from tributors.logger import LOG_LEVEL, LOG_LEVELS
+from tributors.utils.threads import DEFAULT_WORKERS
 
 import tributors
 import argparse
@@ -45,6 +46,36 @@ def get_parser():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--cache-file",
+        dest="cache_file",
+        help="The cache file, a SQLite database if it ends in .db (defaults to .tributors)",
+        default=".tributors",
+    )
+
+    parser.add_argument(
+        "--global-cache",
+        dest="global_cache",
+        help="Share people between repositories in a user identity cache",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--refresh",
+        dest="refresh",
+        help="Refresh up to this many .tributors entries with expired fields",
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--ttl",
+        dest="ttl",
+        help="Days a field is kept before refresh, as [source.]field=days (repeatable)",
+        action="append",
+    )
+
     description = "actions for tributors"
     subparsers = parser.add_subparsers(
         help="tributors actions",
@@ -67,11 +98,36 @@ def get_parser():
     # print version and exit
     subparsers.add_parser("version", help="show software version")
 
+    # Import or export the .tributors cache as json
+    cache = subparsers.add_parser(
+        "cache", help="Import or export the cache (--cache-file) as json"
+    )
+    cache.add_argument(
+        "action",
+        help="Import entries from a json file, or export the cache to one",
+        choices=["import", "export"],
+    )
+    cache.add_argument("filename", help="The json file to import or export")
+
     # Update the .tributors lookup
     update_lookup = subparsers.add_parser(
         "update-lookup",
         help="Update shared .tributors metadata file",
     )
+    update_lookup.add_argument(
+        "--incremental",
+        dest="incremental",
+        help="Only look up GitHub profiles for new or stale contributors",
+        default=False,
+        action="store_true",
+    )
+    update_lookup.add_argument(
+        "--max-age",
+        dest="max_age",
+        help="Age in days after which a GitHub profile is stale (with --incremental)",
+        default=30,
+        type=float,
+    )
     update_lookup.add_argument(
         "files",
         help="One or more files to use for update.",
@@ -93,6 +149,15 @@ def get_parser():
         type=int,
     )
 
+    for command in [update, init, update_lookup]:
+        command.add_argument(
+            "--workers",
+            dest="workers",
+            help="Number of requests to GitHub to make in parallel",
+            default=DEFAULT_WORKERS,
+            type=int,
+        )
+
     for command in [update, init]:
         command.add_argument(
             "--interactive",
@@ -101,6 +166,20 @@ def get_parser():
             default=False,
             action="store_true",
         )
+        command.add_argument(
+            "--review",
+            dest="review",
+            help="Review all orcid ids with more than one match at the end, in one screen.",
+            default=False,
+            action="store_true",
+        )
+        command.add_argument(
+            "--speculative",
+            dest="speculative",
+            help="Run the searches for an orcid id for a person at the same time.",
+            default=False,
+            action="store_true",
+        )
         command.add_argument(
             "parsers",
             help="Metadata file parsers to update or initialize.",
@@ -173,6 +252,8 @@ def main():
         from .update import main
     elif args.command == "update-lookup":
         from .lookup import main
+    elif args.command == "cache":
+        from .cache import main
     else:
         help()
 
@@ -0,0 +1,29 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from tributors.main.store import get_store
+import os
+import sys
+
+
+def main(args, extra):
+    store = get_store(args.cache_file)
+
+    if args.action == "export":
+        if not store.exists():
+            sys.exit("%s does not exist" % args.cache_file)
+        store.export_json(args.filename)
+        print("Exported %s to %s" % (args.cache_file, args.filename))
+
+    elif args.action == "import":
+        if not os.path.exists(args.filename):
+            sys.exit("%s does not exist" % args.filename)
+        cache = store.import_json(args.filename)
+        print("Imported %s, %s has %s entries" % (args.filename, store, len(cache)))
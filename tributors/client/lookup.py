@@ -9,16 +9,26 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 from tributors.main import TributorsClient
+from tributors.main.cache import parse_ttl
 from .utils import parse_extra
 import os
 import sys
 
 
 def main(args, extra):
-    client = TributorsClient(skip_cache=args.skip_cache)
+    client = TributorsClient(
+        skip_cache=args.skip_cache,
+        refresh=args.refresh,
+        ttl=parse_ttl(args.ttl),
+        cache_file=args.cache_file,
+        global_cache=args.global_cache,
+    )
 
     # Parse extra arguments
     extra = parse_extra(extra)
+    extra["--workers"] = args.workers
+    extra["--incremental"] = args.incremental
+    extra["--max-age"] = args.max_age
 
     # Start with user provided parsers
     resources = args.files
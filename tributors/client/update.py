@@ -9,17 +9,27 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 from tributors.main import TributorsClient
+from tributors.main.cache import parse_ttl
 from .utils import parse_extra
 import os
 import sys
 
 
 def main(args, extra):
-    client = TributorsClient(skip_cache=args.skip_cache)
+    client = TributorsClient(
+        skip_cache=args.skip_cache,
+        refresh=args.refresh,
+        ttl=parse_ttl(args.ttl),
+        cache_file=args.cache_file,
+        global_cache=args.global_cache,
+    )
 
     # Parse extra arguments
     extra = parse_extra(extra)
     extra["--interactive"] = args.interactive
+    extra["--speculative"] = args.speculative
+    extra["--review"] = args.review
+    extra["--workers"] = args.workers
 
     # Start with user provided parsers
     parsers = args.parsers
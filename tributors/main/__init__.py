@@ -8,11 +8,11 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 """
 
+from tributors.main.cache import refresh, TributorsCache
 from tributors.main.parsers import get_named_parser
-from tributors.utils.file import write_json, read_json
+from tributors.main.store import get_store, IdentityStore, Journal
 from .github import GitHubRepository
 import logging
-import os
 
 bot = logging.getLogger("tributors.main")
 
@@ -23,14 +23,36 @@ class TributorsClient:
     we can cache and reuse the GitHub calls.
     """
 
-    def __init__(self, skip_cache=False):
+    def __init__(
+        self,
+        skip_cache=False,
+        refresh=0,
+        ttl=None,
+        cache_file=None,
+        journal=True,
+        global_cache=False,
+    ):
         """create a tributors client to control one or more updates to
         contribution files. The .tributors cache stores identifiers that
         would need to be looked up, and the client stores a contributors
         cache (from GitHub) that can be used between parser clients.
+        Up to refresh entries with fields older than their time to live
+        (ttl, a policy by source and field) are refreshed on this run.
+        The cache_file (default .tributors) can also be a SQLite database.
+        With journal, changes to the cache are also written to a journal
+        as they happen, so an interrupted run can pick up where it stopped.
+        With global_cache, people are also shared between repositories in an
+        identity cache in the user cache directory.
         """
+        self.refresh = refresh
+        self.ttl = ttl
+        self.journal = journal
+        self.store = get_store(cache_file)
+        self.cache = TributorsCache()
         if not skip_cache:
             self.load_cache()
+        if global_cache:
+            self.cache.identities = IdentityStore()
         self.skip_cache = skip_cache
 
     def load_cache(self):
@@ -40,15 +62,28 @@ class TributorsClient:
         store emails / orcid id / username combos. For temporary
         (GitHub request) caches, we use /tmp.
         """
-        self.cache = {}
-        if os.path.exists(".tributors"):
-            self.cache = read_json(".tributors")
+        self.cache = TributorsCache(self.store.load())
+        self.cache.filename = self.store.filename
+
+        # Changes that were not saved (e.g., the run exited) are recovered
+        if self.journal:
+            journal = Journal(self.store.filename + ".journal", self.store.filename)
+            count = journal.replay(self.cache)
+            if count:
+                bot.info(f"Recovered {count} unsaved changes from {journal.filename}")
+            self.cache.journal = journal
+        refresh(self.cache, self.refresh, self.ttl)
 
     def save_cache(self):
-        """Save the current self.cache to the cache file .tributors in the PWD"""
+        """Save the current self.cache to the cache file (.tributors) in the PWD"""
+        if self.cache.identities is not None:
+            count = self.cache.identities.merge(self.cache)
+            bot.debug(f"Shared {count} entries with {self.cache.identities}")
         if not self.skip_cache:
-            bot.debug("Saving cache to .tributors")
-            write_json(self.cache, ".tributors")
+            self.store.save(self.cache, changed=self.cache.dirty)
+            self.cache.clean()
+            if self.cache.journal:
+                self.cache.journal.clear()
 
     def __str__(self):
         return "[TributorsClient]"
@@ -71,7 +106,7 @@ class TributorsClient:
         parsers = parsers or []
 
         # Generate a shared repository object
-        repo = GitHubRepository(repo, skip_users)
+        repo = GitHubRepository(repo, skip_users, params=params)
 
         # Get resource lookup ids (emails, orcids, logins, most won't be used for init)
         resources = self.get_resource_lookups(from_resources, params)
@@ -114,7 +149,7 @@ class TributorsClient:
         parsers = parsers or []
 
         # Generate a shared repository object
-        repo = GitHubRepository(repo, skip_users=skip_users)
+        repo = GitHubRepository(repo, skip_users=skip_users, params=params)
         bot.debug(f"Found repository {repo}")
 
         # Get resource lookup ids (emails, orcids, logins)
@@ -139,22 +174,25 @@ class TributorsClient:
         lookups = {"login": set(), "orcid": set(), "email": set(), "name": set()}
 
         for name in from_resources:
-            # Special case, tributors is just the entire cache
-            if name == "tributors":
-                lookups["login"].update(self.cache)
-                lookups["name"].update(
-                    {x["name"]: x for _, x in self.cache.items() if "name" in x}
-                )
-                lookups["orcid"].update(
-                    {x["orcid"]: x for _, x in self.cache.items() if "orcid" in x}
-                )
-                lookups["email"].update(
-                    {x["email"]: x for _, x in self.cache.items() if "email" in x}
-                )
-            else:
-                parser = get_named_parser(name=name, params=params)
-                lookups["name"].update(parser.name_lookup)
-                lookups["login"].update(parser.login_lookup)
-                lookups["email"].update(parser.email_lookup)
-                lookups["orcid"].update(parser.orcid_lookup)
+            for key, values in self.get_resource_lookup(name, params).items():
+                lookups[key].update(values)
         return lookups
+
+    def get_resource_lookup(self, name, params=None):
+        """Return the unique ids (email, login, orcid, name) for one resource"""
+        # Special case, tributors is just the entire cache
+        if name == "tributors":
+            return {
+                "login": set(self.cache),
+                "name": self.cache.unique("name"),
+                "orcid": self.cache.unique("orcid"),
+                "email": self.cache.unique("email"),
+            }
+
+        parser = get_named_parser(name=name, params=params)
+        return {
+            "name": set(parser.name_lookup),
+            "login": set(parser.login_lookup),
+            "email": set(parser.email_lookup),
+            "orcid": set(parser.orcid_lookup),
+        }
@@ -0,0 +1,156 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from tributors.main import TributorsClient
+from tributors.main.cache import TributorsCache
+from tributors.main.parsers import get_named_parser
+from tributors.main.store import get_store
+from tributors.utils.threads import scope
+from .github import GitHubRepository
+import asyncio
+
+
+class AsyncTributorsClient(TributorsClient):
+    """An asyncio client to interact with one or more contributor actions.
+    Blocking GitHub, ORCID and Zenodo calls run in threads of the event
+    loop, so many clients (e.g., one per repository) can share one process
+    and the same connection pool. Results are returned in memory, and
+    contribution files (and the .tributors cache) are only written if save
+    is True. Caches of requests in the user cache directory (responses and
+    ORCID searches) are still written, see TRIBUTORS_CACHE_DIR. Repository
+    metadata and ORCID records are shared by calls that overlap, and
+    forgotten once no call uses them, so a long running process always
+    gets current metadata.
+    """
+
+    def __init__(
+        self, skip_cache=True, cache=None, refresh=0, ttl=None, cache_file=None
+    ):
+        """create an async tributors client. By default we don't read or
+        write the .tributors cache, but a cache (dict) can be provided, and
+        a copy of it (a TributorsCache) is updated and returned.
+        """
+        self.skip_cache = skip_cache
+        self.refresh = refresh
+        self.ttl = ttl
+        self.store = get_store(cache_file)
+        self.journal = False
+        self.cache = TributorsCache(cache)
+        self.cache.dirty = set(self.cache)
+        if cache is None and not skip_cache:
+            self.load_cache()
+
+    def __str__(self):
+        return "[AsyncTributorsClient]"
+
+    async def init(
+        self,
+        parsers=None,
+        repo=None,
+        params=None,
+        force=False,
+        skip_users=None,
+        from_resources=None,
+        save=False,
+    ):
+        """Init one or more contributor parsers, and return a lookup of
+        parser name to generated metadata.
+        """
+        repo = GitHubRepository(repo, skip_users, params=params)
+        with scope():
+            resources, _ = await asyncio.gather(
+                self.get_resource_lookups(from_resources, params),
+                self.prefetch(repo),
+            )
+            results = {}
+            for parser in parsers or []:
+                client = get_named_parser(name=parser, repo=repo, params=params)
+                client.cache = self.cache
+                results[parser] = await asyncio.to_thread(
+                    client.init, force=force, from_resources=resources, save=save
+                )
+                self.cache.update(client.cache)
+
+        if save:
+            self.save_cache()
+        return results
+
+    async def update_resource(self, resources=None, params=None, save=False):
+        """Given one or more resource types (an external file or source of
+        metadata) update and return the .tributors cache lookup
+        """
+        with scope():
+            for name in resources or []:
+                resource = get_named_parser(name=name, params=params)
+                resource.cache = self.cache
+                await asyncio.to_thread(resource.update_lookup)
+
+        if save:
+            self.save_cache()
+        return self.cache
+
+    async def update(
+        self,
+        parsers=None,
+        repo=None,
+        params=None,
+        thresh=1,
+        skip_users=None,
+        from_resources=None,
+        save=False,
+    ):
+        """Update one or more contributor parsers, and return a lookup of
+        parser name to updated metadata. Parsers run one after the other
+        since they share (and add to) the same cache.
+        """
+        repo = GitHubRepository(repo, skip_users=skip_users, params=params)
+        with scope():
+            resources, _ = await asyncio.gather(
+                self.get_resource_lookups(from_resources, params),
+                self.prefetch(repo),
+            )
+            results = {}
+            for parser in parsers or []:
+                client = get_named_parser(name=parser, repo=repo, params=params)
+                client.cache = self.cache
+                results[parser] = await asyncio.to_thread(
+                    client.update, thresh=thresh, from_resources=resources, save=save
+                )
+                self.cache.update(client.cache)
+
+        if save:
+            self.save_cache()
+        return results
+
+    async def get_resource_lookups(self, from_resources=None, params=None):
+        """Retrieve the unique ids (email, login, orcid, name) for each
+        resource concurrently, and return them combined.
+        """
+        from_resources = from_resources or ["github"]
+        lookups = {"login": set(), "orcid": set(), "email": set(), "name": set()}
+        results = await asyncio.gather(
+            *[
+                asyncio.to_thread(self.get_resource_lookup, name, params)
+                for name in from_resources
+            ]
+        )
+        for result in results:
+            for key, values in result.items():
+                lookups[key].update(values)
+        return lookups
+
+    async def prefetch(self, repo):
+        """Retrieve repository metadata and contributors concurrently, so
+        the parsers find them already shared by the repository registry.
+        """
+        await asyncio.gather(
+            asyncio.to_thread(lambda: repo.repo),
+            asyncio.to_thread(lambda: repo.contributors),
+        )
@@ -0,0 +1,453 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from datetime import datetime, timezone
+import logging
+
+bot = logging.getLogger("tributors.cache")
+
+# Each .tributors entry can record where and when a field was obtained under
+# this key. Fields without provenance (e.g., edited by hand) never expire.
+PROVENANCE = "_provenance"
+
+# Time to live (in days) for a field by source. A source can define a
+# default for all fields with None.
+DEFAULT_TTL = {
+    "github": {None: 90, "name": 180},
+    "orcid": {None: 365, "affiliation": 180},
+    None: {None: 365},
+}
+
+
+# Fields of an entry that the cache keeps an index of
+INDEXED_FIELDS = ["email", "orcid", "name"]
+
+
+def normalize_name(name):
+    """Normalize a name (case and whitespace) to compare or index it"""
+    if name:
+        return " ".join(name.lower().split())
+
+
+def get_index_key(field, value):
+    """Get the key for a value in the index of a field"""
+    if field == "name":
+        return normalize_name(value)
+    return value
+
+
+class CacheEntry(dict):
+    """An entry in the .tributors cache. It is a dictionary that tells the
+    cache that holds it when a field changes.
+    """
+
+    __slots__ = ["cache", "login"]
+
+    def __init__(self, *args, cache=None, login=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.login = login
+
+    def __setitem__(self, field, value):
+        old = self.get(field)
+        super().__setitem__(field, value)
+        self.changed(field, old)
+
+    def __delitem__(self, field):
+        old = self.get(field)
+        super().__delitem__(field)
+        self.changed(field, old)
+
+    def pop(self, field, *args):
+        if field not in self:
+            return super().pop(field, *args)
+        old = self.get(field)
+        value = super().pop(field)
+        self.changed(field, old)
+        return value
+
+    def popitem(self):
+        field, value = super().popitem()
+        self.changed(field, value)
+        return field, value
+
+    def setdefault(self, field, default=None):
+        if field not in self:
+            self[field] = default
+        return self[field]
+
+    def update(self, *args, **kwargs):
+        for field, value in dict(*args, **kwargs).items():
+            self[field] = value
+
+    def clear(self):
+        for field in list(self):
+            del self[field]
+
+    def changed(self, field, old):
+        """Mark the entry as changed, and update the index for the field"""
+        if self.cache is None:
+            return
+        self.cache.dirty.add(self.login)
+        if field in self:
+            self.cache.removed.get(self.login, {}).pop(field, None)
+            self.cache.record(
+                {"login": self.login, "field": field, "value": self[field]}
+            )
+        else:
+            if field != PROVENANCE:
+                self.cache.removed.setdefault(self.login, {})[field] = now()
+            self.cache.record({"login": self.login, "field": field, "deleted": True})
+        if field in INDEXED_FIELDS:
+            self.cache.reindex(self.login, field, old, self.get(field))
+
+
+class TributorsCache(dict):
+    """The .tributors cache, a dictionary of entries by GitHub login. The
+    cache keeps an index of logins by email, orcid and (normalized) name,
+    which is updated as entries are added, changed or removed, so finding
+    an entry by an identifier doesn't need a scan of the cache. The logins
+    of entries changed since the cache was created (or saved) are dirty,
+    and each change is recorded in the journal, if the cache has one. We
+    also keep when fields were removed from entries, so the removal can be
+    shared (see merge_entries), and the cache file the entries were loaded
+    from, if any.
+    """
+
+    def __init__(self, entries=None):
+        super().__init__()
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.dirty = set()
+        self.removed = {}
+        self.journal = None
+        self.identities = None
+        self.filename = None
+        for login, entry in (entries or {}).items():
+            self[login] = entry
+        self.clean()
+
+    def __str__(self):
+        return "[tributors-cache][%s]" % len(self)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __setitem__(self, login, entry):
+        if login in self:
+            if entry is self[login]:
+                return
+            self.unindex(login)
+        entry = CacheEntry(entry, cache=self, login=login)
+        super().__setitem__(login, entry)
+        self.dirty.add(login)
+        self.record({"login": login, "entry": entry})
+        for field in INDEXED_FIELDS:
+            self.reindex(login, field, None, entry.get(field))
+
+    def __delitem__(self, login):
+        self.unindex(login)
+        super().__delitem__(login)
+        self.dirty.add(login)
+        self.record({"login": login, "deleted": True})
+
+    def pop(self, login, *args):
+        if login in self:
+            self.unindex(login)
+            self.dirty.add(login)
+            self.record({"login": login, "deleted": True})
+        return super().pop(login, *args)
+
+    def popitem(self):
+        login = next(reversed(self))
+        return login, self.pop(login)
+
+    def setdefault(self, login, default=None):
+        if login not in self:
+            self[login] = default if default is not None else {}
+        return self[login]
+
+    def update(self, *args, **kwargs):
+        for login, entry in dict(*args, **kwargs).items():
+            self[login] = entry
+
+    def clear(self):
+        for login in list(self):
+            del self[login]
+
+    def recall(self, logins, source=None):
+        """Fill entries for logins from the shared identity store (if there
+        is one). New logins are added, and fields that an entry doesn't have
+        are filled. An entry is found by login, and then by email or orcid.
+        Returns the logins with a shared entry (with a field from source).
+        """
+        if self.identities is None:
+            return set()
+        people = [
+            (
+                (x, self[x].get("email"), self[x].get("orcid"))
+                if x in self
+                else (x, None, None)
+            )
+            for x in logins
+        ]
+        found = set()
+        for login, shared in self.identities.recall(people).items():
+            if login not in self:
+                self[login] = {}
+            fill_entry(self[login], shared)
+            sources = shared.get(PROVENANCE, {}).values()
+            if source is None or any(x.get("source") == source for x in sources):
+                found.add(login)
+        return found
+
+    def record(self, change):
+        """Record a change in the journal (if there is one)"""
+        if self.journal is not None:
+            self.journal.append(change)
+
+    def clean(self):
+        """Mark all entries as saved"""
+        self.dirty = set()
+        self.removed = {}
+
+    def unindex(self, login):
+        """Remove an entry from the indexes, e.g., before it is replaced"""
+        entry = self[login]
+        entry.cache = None
+        for field in INDEXED_FIELDS:
+            self.reindex(login, field, entry.get(field), None)
+
+    def reindex(self, login, field, old, new):
+        """Move a login from the old to the new value in an index"""
+        index = self.indexes[field]
+        old, new = get_index_key(field, old), get_index_key(field, new)
+        if old == new:
+            return
+        if old and isinstance(old, str):
+            logins = index.get(old)
+            if logins is not None:
+                logins.pop(login, None)
+                if not logins:
+                    del index[old]
+        if new and isinstance(new, str):
+            index.setdefault(new, {})[login] = None
+
+    def find(self, field, value):
+        """Find entries with a value for a field (email, orcid or name, which
+        is compared normalized). Returns entries by login.
+        """
+        logins = self.indexes[field].get(get_index_key(field, value), {})
+        return {login: self[login] for login in logins}
+
+    def get_by(self, field, value, default=None):
+        """Get the first entry with a value for a field, or the default"""
+        logins = self.indexes[field].get(get_index_key(field, value))
+        if not logins:
+            return default
+        return self[next(iter(logins))]
+
+    def unique(self, field):
+        """Get the unique values of a field across entries"""
+        if field != "name":
+            return set(self.indexes[field])
+        return {
+            self[login]["name"]
+            for logins in self.indexes["name"].values()
+            for login in logins
+        }
+
+
+def fill_entry(entry, other):
+    """Add the fields (and their provenance) of another entry for the same
+    person that an entry doesn't have. Returns the fields that were added.
+    """
+    added = [x for x in other if x != PROVENANCE and x not in entry]
+    if not added:
+        return added
+    provenance = dict(entry.pop(PROVENANCE, {}))
+    for field in added:
+        entry[field] = other[field]
+        meta = other.get(PROVENANCE, {}).get(field)
+        if meta:
+            provenance[field] = {k: v for k, v in meta.items() if k != "stale"}
+    if provenance:
+        entry[PROVENANCE] = provenance
+    return added
+
+
+def merge_entries(old, new, removed=None):
+    """Merge a new entry for a person into an old one, keeping the most
+    recently updated value of each field. A field from a source is kept
+    over the same field without provenance (e.g., edited by hand in one
+    repository). Fields removed from the new entry (removed, by time of
+    removal) are replaced with a tombstone in the provenance, so a value
+    updated before the removal doesn't come back. Fields marked for
+    refresh are not marked in the result.
+    """
+    merged = {k: v for k, v in old.items() if k != PROVENANCE}
+    provenance = {k: dict(v) for k, v in old.get(PROVENANCE, {}).items()}
+    updates = new.get(PROVENANCE, {})
+    for field, value in new.items():
+        if field == PROVENANCE:
+            continue
+        current, update = provenance.get(field), updates.get(field)
+        if current and (update or field in merged):
+            if not update or update["updated"] < current["updated"]:
+                continue
+
+            # A removal wins over a value updated at the same time
+            if current.get("deleted") and update["updated"] == current["updated"]:
+                continue
+        merged[field] = value
+        if update:
+            provenance[field] = dict(update)
+        else:
+            provenance.pop(field, None)
+
+    for field, updated in (removed or {}).items():
+        current = provenance.get(field)
+        if field in new or (current and current["updated"] > updated):
+            continue
+        merged.pop(field, None)
+        provenance[field] = {"deleted": True, "updated": updated}
+    for meta in provenance.values():
+        meta.pop("stale", None)
+    if provenance:
+        merged[PROVENANCE] = provenance
+    return merged
+
+
+def now():
+    """Return the current time as an ISO 8601 UTC timestamp"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def set_field(entry, field, value, source):
+    """Set a field in a cache entry, recording the source and time. We keep
+    the provenance last in the entry so the fields read first in the file.
+    """
+    provenance = entry.pop(PROVENANCE, {})
+    entry[field] = value
+    provenance[field] = {"source": source, "updated": now()}
+    entry[PROVENANCE] = provenance
+    return entry
+
+
+def unset_field(entry, field):
+    """Remove a field (and its provenance) from a cache entry"""
+    entry.pop(field, None)
+    provenance = entry.get(PROVENANCE, {})
+    provenance.pop(field, None)
+    if PROVENANCE in entry and not provenance:
+        del entry[PROVENANCE]
+    return entry
+
+
+def is_stale(entry, field, source=None):
+    """Determine if a field was marked for refresh. With a source, only a
+    field that came from that source (and so can be refreshed by it) counts.
+    """
+    meta = entry.get(PROVENANCE, {}).get(field, {})
+    if source is not None and meta.get("source") != source:
+        return False
+    return meta.get("stale", False)
+
+
+def needs_update(entry, field, source=None):
+    """A field should be updated if it is missing, or marked for refresh
+    (and with a source, came from it)
+    """
+    return field not in entry or is_stale(entry, field, source)
+
+
+def revalidate(entry, field, value, source, remove=True):
+    """Given a field that was marked for refresh and the current value from
+    its source, update it. If the source no longer has a value the field is
+    removed, unless remove is False (e.g., a search that is inconclusive)
+    and then the current value is kept. Fields that are not marked for
+    refresh, or that came from another source, are left alone (the other
+    source refreshes them) and we return False.
+    """
+    if not is_stale(entry, field, source):
+        return False
+    if value:
+        set_field(entry, field, value, source)
+    elif remove:
+        unset_field(entry, field)
+    else:
+        set_field(entry, field, entry[field], entry[PROVENANCE][field]["source"])
+    return True
+
+
+def get_ttl(field, source, ttl=None):
+    """Get the time to live (in days) for a field from a source"""
+    ttl = ttl or DEFAULT_TTL
+    for policy in [ttl.get(source, {}), ttl.get(None, {}), DEFAULT_TTL[None]]:
+        for key in [field, None]:
+            if key in policy:
+                return policy[key]
+
+
+def parse_ttl(values):
+    """Parse time to live policies, each formatted as [source.]field=days
+    or source.*=days, into a policy lookup updating the defaults.
+    """
+    ttl = {source: dict(policy) for source, policy in DEFAULT_TTL.items()}
+    for value in values or []:
+        key, days = value.split("=", 1)
+        source, field = key.split(".", 1) if "." in key else (None, key)
+        ttl.setdefault(source, {})[None if field == "*" else field] = float(days)
+    return ttl
+
+
+def is_expired(field, meta, current, ttl=None):
+    """Given a field and its provenance, determine if it has expired"""
+    updated = datetime.fromisoformat(meta["updated"])
+    days = get_ttl(field, meta.get("source"), ttl)
+    return (current - updated).total_seconds() > days * 86400
+
+
+def refresh(cache, limit, ttl=None):
+    """Mark expired fields for refresh, for at most limit entries, starting
+    with the entries that have the oldest expired field. Marked fields
+    are updated by the next parser or resource that provides them, so the
+    cost of keeping a large cache fresh is spread across runs. Fields that
+    are already marked (e.g., their source didn't run) stay marked, but
+    don't count toward the limit, so later runs move on to other entries.
+    """
+    if not limit:
+        return []
+
+    expired = []
+    current = datetime.now(timezone.utc)
+    for login, entry in cache.items():
+        updated = [
+            meta["updated"]
+            for field, meta in entry.get(PROVENANCE, {}).items()
+            if field in entry
+            and not meta.get("stale")
+            and is_expired(field, meta, current, ttl)
+        ]
+        if updated:
+            expired.append((min(updated), login))
+
+    refreshed = [login for _, login in sorted(expired)[:limit]]
+    for login in refreshed:
+        entry = cache[login]
+        provenance = entry[PROVENANCE]
+        for field, meta in provenance.items():
+            if is_expired(field, meta, current, ttl):
+                meta["stale"] = True
+
+        # Set the provenance again so the cache knows the entry changed
+        entry[PROVENANCE] = provenance
+    if refreshed:
+        bot.info(f"Refreshing {len(refreshed)} of {len(expired)} expired entries")
+    return refreshed
@@ -0,0 +1,304 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from collections.abc import Mapping
+import sys
+
+# The fields of a contributor that tributors uses, anything else is dropped
+CONTRIBUTOR_FIELDS = (
+    "login",
+    "type",
+    "contributions",
+    "html_url",
+    "avatar_url",
+    "name",
+    "email",
+    "orcid",
+    "affiliation",
+    "blog",
+)
+
+
+def intern(value):
+    """Intern a string, so values repeated across contributors (the type,
+    an affiliation) are stored once.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class Contributor:
+    """A contributor is a compact record of a person, with only the fields
+    tributors uses (and no dictionary per instance). It can be read like
+    the dictionary it replaces (contributor["type"], contributor.get("name"))
+    where a field that isn't set is missing, and has adapters to and from
+    GitHub responses, .tributors cache entries and each file format.
+    """
+
+    __slots__ = CONTRIBUTOR_FIELDS
+
+    def __init__(self, login=None, **fields):
+        unknown = set(fields).difference(CONTRIBUTOR_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown contributor fields {', '.join(sorted(unknown))}")
+        self.login = intern(login)
+        for field in CONTRIBUTOR_FIELDS[1:]:
+            setattr(self, field, intern(fields.get(field)))
+
+    def __str__(self):
+        return "[contributor][%s]" % (self.login or self.name)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __eq__(self, other):
+        if not isinstance(other, Contributor):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __getitem__(self, field):
+        value = getattr(self, field, None) if field in CONTRIBUTOR_FIELDS else None
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def get(self, field, default=None):
+        if field not in CONTRIBUTOR_FIELDS:
+            return default
+        value = getattr(self, field)
+        return default if value is None else value
+
+    def fill(self, other):
+        """Set fields that aren't set from another contributor (or dict)"""
+        for field in CONTRIBUTOR_FIELDS:
+            if getattr(self, field) is None and other:
+                setattr(self, field, intern(other.get(field)))
+        return self
+
+    def to_dict(self):
+        """The fields that are set, as a dictionary"""
+        return {
+            field: getattr(self, field)
+            for field in CONTRIBUTOR_FIELDS
+            if getattr(self, field) is not None
+        }
+
+    # Adapters from sources
+
+    @classmethod
+    def from_github(cls, data):
+        """A contributor from a GitHub contributor (or user) response"""
+        return cls(**{k: v for k, v in data.items() if k in CONTRIBUTOR_FIELDS})
+
+    @classmethod
+    def from_cache(cls, login, entry):
+        """A contributor from an entry of the .tributors cache"""
+        fields = ["name", "email", "orcid", "affiliation", "blog"]
+        return cls(login, **{x: entry.get(x) for x in fields})
+
+    @classmethod
+    def from_allcontrib(cls, entry):
+        """A contributor from an .all-contributorsrc entry"""
+        return cls(
+            entry.get("login"),
+            name=entry.get("name"),
+            blog=entry.get("profile"),
+            avatar_url=entry.get("avatar_url"),
+        )
+
+    @classmethod
+    def from_zenodo(cls, entry):
+        """A contributor from a .zenodo.json creator"""
+        fields = ["name", "email", "orcid", "affiliation"]
+        return cls(**{x: entry.get(x) for x in fields})
+
+    @classmethod
+    def from_codemeta(cls, entry):
+        """A contributor from a codemeta.json (schema.org Person) contributor"""
+        names = [entry.get("givenName"), entry.get("familyName")]
+        orcid = entry.get("@id")
+        return cls(
+            name=" ".join(x for x in names if x) or None,
+            email=entry.get("email"),
+            orcid=orcid.split("/")[-1] if orcid else None,
+        )
+
+    # Adapters to file formats
+
+    def to_allcontrib(self, ctype):
+        """An .all-contributorsrc entry, with one contribution type"""
+        return {
+            "login": self.login,
+            "name": self.name or self.login,
+            "contributions": [ctype],
+            "profile": self.blog or self.html_url,
+            "avatar_url": self.avatar_url,
+        }
+
+    def to_zenodo(self):
+        """A .zenodo.json creator"""
+        entry = {"name": self.name or self.login}
+        for field in ["affiliation", "orcid"]:
+            if getattr(self, field) is not None:
+                entry[field] = getattr(self, field)
+        return entry
+
+    def to_codemeta(self):
+        """A codemeta.json (schema.org Person) contributor"""
+        parts = (self.name or self.login).split(" ")
+        entry = {"@type": "Person", "givenName": parts[0]}
+
+        # Add the last name if it's defined
+        if len(parts) > 1:
+            entry["familyName"] = " ".join(parts[1:])
+        if self.email is not None:
+            entry["email"] = self.email
+        if self.orcid is not None:
+            entry["@id"] = "https://orcid.org/%s" % self.orcid
+        return entry
+
+
+class ContributorList(list):
+    """A contributor list is the list of entries (dictionaries) of a file
+    format, e.g., the creators of a .zenodo.json, with an index of entries
+    by each key (e.g., email or orcid). A key is a field of an entry, or a
+    function that derives the value from an entry. The indexes are updated
+    as entries are added or removed, so finding an entry (or checking for
+    one) doesn't need a scan. If an entry is changed in place, reindex it.
+    """
+
+    def __init__(self, entries=None, keys=None):
+        super().__init__()
+        self.keys = keys or {}
+        self.indexes = {name: {} for name in self.keys}
+        self.indexed = {}
+        self.extend(entries or [])
+
+    def __str__(self):
+        return "[contributor-list][%s]" % len(self)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __contains__(self, entry):
+        """Only entries with the same value for a key can be equal"""
+        keys = self.get_keys(entry)
+        if not keys:
+            return super().__contains__(entry)
+        name, value = next(iter(keys.items()))
+        return entry in self.indexes[name].get(value, [])
+
+    def append(self, entry):
+        super().append(entry)
+        self._add_to_index(entry)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+    # Other changes are less common, and rebuild the indexes
+
+    def __setitem__(self, *args):
+        super().__setitem__(*args)
+        self.rebuild()
+
+    def __delitem__(self, *args):
+        super().__delitem__(*args)
+        self.rebuild()
+
+    def insert(self, *args):
+        super().insert(*args)
+        self.rebuild()
+
+    def remove(self, *args):
+        super().remove(*args)
+        self.rebuild()
+
+    def pop(self, *args):
+        entry = super().pop(*args)
+        self.rebuild()
+        return entry
+
+    def clear(self):
+        super().clear()
+        self.rebuild()
+
+    def get_keys(self, entry):
+        """Get the (defined) value of each key for an entry"""
+        keys = {}
+        for name, key in self.keys.items():
+            value = key(entry) if callable(key) else entry.get(key)
+            if value is not None:
+                keys[name] = value
+        return keys
+
+    def _add_to_index(self, entry):
+        keys = self.get_keys(entry)
+        self.indexed[id(entry)] = keys
+        for name, value in keys.items():
+            self.indexes[name].setdefault(value, []).append(entry)
+
+    def _remove_from_index(self, entry):
+        for name, value in self.indexed.pop(id(entry), {}).items():
+            entries = self.indexes[name][value]
+            entries[:] = [x for x in entries if x is not entry]
+            if not entries:
+                del self.indexes[name][value]
+
+    def reindex(self, entry):
+        """Update the indexes for an entry that was changed in place"""
+        self._remove_from_index(entry)
+        self._add_to_index(entry)
+
+    def rebuild(self):
+        """Rebuild the indexes in place, so lookups (views) stay current"""
+        for index in self.indexes.values():
+            index.clear()
+        self.indexed.clear()
+        for entry in self:
+            self._add_to_index(entry)
+
+    def find(self, name, value, default=None):
+        """Find the (last added) entry with a value for a key"""
+        entries = self.indexes[name].get(value)
+        return entries[-1] if entries else default
+
+    def lookup(self, name):
+        """A read only lookup of entries by the values of a key"""
+        return IndexLookup(self.indexes[name])
+
+
+class IndexLookup(Mapping):
+    """A lookup of (the last added) entries by the values of a key, a view
+    of the index of a contributor list, so it is always current.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, value):
+        return self.index[value][-1]
+
+    def __contains__(self, value):
+        return value in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
@@ -8,15 +8,39 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 """
 
+from tributors.main import http
+from tributors.main.cache import is_stale, revalidate, set_field, TributorsCache
+from tributors.main.contributor import Contributor
 from tributors.utils.command import Command
+from tributors.utils.file import get_cache_dir, read_json, write_json
+from tributors.utils.threads import parallel_map, SingleFlight, DEFAULT_WORKERS
+from urllib.parse import parse_qs, urlparse
+import functools
+import hashlib
+import json
 import logging
 import os
 import re
-import requests
 import sys
+import time
 
 repository_regex = r"(?P<owner>[\w,\-,\_]+)/(?P<repo>[\w,\-,\_\.]+)"
 
+# The maximum page size allowed by the GitHub API
+PER_PAGE = 100
+
+# The number of users to request in one GraphQL query
+GRAPHQL_BATCH = 100
+
+# Default age (in days) after which a contributor profile is refreshed
+DEFAULT_MAX_AGE = 30
+
+# Repository metadata shared by GitHubRepository objects in the process,
+# keyed by (uid, resource) so each resource is fetched once per REGISTRY_TTL
+# (seconds). Failed lookups are not kept.
+REGISTRY_TTL = 600
+registry = SingleFlight(ttl=REGISTRY_TTL)
+
 bot = logging.getLogger("github")
 
 
@@ -32,7 +56,7 @@ class GitHubRepository:
         self.uid = get_github_repository(repo)
         self.skip_users = skip_users or []
         self.params = params or {}
-        self.cache = {}
+        self.cache = TributorsCache()
 
     def include_contributor(self, login):
         """Given a threshold (and preference to not include bots) return a boolean
@@ -55,27 +79,59 @@ class GitHubRepository:
         if not self.skip_users:
             self.skip_users = self.params.get("--skip-users", "").split(" ")
 
-        # Iterate through GitHub and update metadata
-        for login, contributor in self.contributors.items():
-            # Don't include bots, and others specified with --skip-user
-            if not self.include_contributor(login):
-                continue
+        # Don't include bots, and others specified with --skip-user
+        included = [x for x in self.contributors if self.include_contributor(x)]
 
-            # Look up a GitHub username, possibly email and site
-            user = get_user(login)
+        # New contributors looked up for another repository are shared
+        known = self.cache.recall(
+            [x for x in included if x not in self.cache], source="github"
+        )
+        if known:
+            bot.info(f"Found {len(known)} new contributors in the identity cache")
+
+        # In incremental mode, only look up new or stale contributors
+        state = None
+        logins = included
+        if self.params.get("--incremental"):
+            state = SyncState(self.uid, self.cache.filename)
+            max_age = float(self.params.get("--max-age", DEFAULT_MAX_AGE))
+            logins = state.select(included, self.cache, max_age)
+        logins = [x for x in logins if x not in known]
+
+        # Look up GitHub usernames (possibly email and site) in batches
+        workers = int(self.params.get("--workers", DEFAULT_WORKERS))
+        users = get_users(logins, workers=workers)
+
+        limits = http.rate_limit()
+        if limits:
+            bot.debug(f"GitHub API requests remaining: {limits['remaining']}")
+
+        # Update metadata in the same order as GitHub contributors
+        for login, user in zip(logins, users):
+            # We could not retrieve the user, try again next time
+            if not user:
+                continue
 
-            entry = {"name": user.get("name") or login}
             if login in self.cache:
                 entry = self.cache[login]
+                revalidate(entry, "name", user.get("name") or login, "github")
             else:
+                entry = set_field({}, "name", user.get("name") or login, "github")
                 bot.info(f"⭐️ new contributor {login}")
 
-            # Update cache with fields that aren't defined yet
+            # Update cache with fields that aren't defined yet (or are stale)
             for key in ["email", "bio", "blog"]:
-                if user.get(key) and key not in entry:
-                    entry[key] = user.get(key)
+                if revalidate(entry, key, user.get(key), "github"):
+                    bot.info(f"  Refreshing {login} {key}: {entry.get(key)}")
+                elif user.get(key) and key not in entry:
+                    set_field(entry, key, user.get(key), "github")
                     bot.info(f"  Updating {login} with {key}: {entry[key]}")
             self.cache[login] = entry
+            if state:
+                state.fetched(login)
+
+        if state:
+            state.save(included)
         return self.cache
 
     def __str__(self):
@@ -88,7 +144,7 @@ class GitHubRepository:
     def repo(self):
         """Retrieve the GitHub repository, if we don't have it yet"""
         if not self._repo:
-            self._repo = get_repo(self.uid)
+            self._repo = registry.do((self.uid, "repo"), get_repo, self.uid)
         return self._repo
 
     # Equivalent methods to a parser to get lookups based on primary ids
@@ -116,13 +172,18 @@ class GitHubRepository:
     def contributors(self):
         """Return list of contributors, and retrieve if we don't have yet"""
         if not self._contributors:
-            self._contributors = get_contributors(self.uid)
+            workers = int(self.params.get("--workers", DEFAULT_WORKERS))
+            self._contributors = registry.do(
+                (self.uid, "contributors"), get_contributors, self.uid, workers=workers
+            )
         return self._contributors
 
     def topics(self, topics=None):
-        """Return list of topics, optionally add extras and return unique set"""
+        """Return list of topics, optionally add extras and return unique set.
+        Topics are part of the repository metadata we already retrieve.
+        """
         if not self._topics:
-            self._topics = get_topics(self.uid)
+            self._topics = (self.repo or {}).get("topics", [])
         topics = topics or []
         return list(set(self._topics + topics))
 
@@ -147,6 +208,75 @@ class GitHubRepository:
         return "https://spdx.org/licenses/%s" % self.repo["license"]["spdx_id"]
 
 
+class SyncState:
+    """The sync state for a repository records when each contributor profile
+    was last retrieved, so we only look up new or stale contributors. It is
+    stored in the user cache directory for each cache file (by repository),
+    and only kept in memory if there is no cache file.
+    """
+
+    # Profile fields we can add to the cache
+    fields = ["email", "bio", "blog"]
+
+    def __init__(self, uid, cache_file=None):
+        self.uid = uid
+        self.filename = None
+        if cache_file:
+            key = hashlib.sha256(os.path.abspath(cache_file).encode("utf8"))
+            self.filename = os.path.join(
+                get_cache_dir("sync"), "%s.json" % key.hexdigest()[:16]
+            )
+        self.data = {"fetched": {}}
+        if self.filename and os.path.exists(self.filename):
+            self.data = read_json(self.filename).get(uid, self.data)
+
+    def __str__(self):
+        return "[sync-state][%s]" % self.uid
+
+    def __repr__(self):
+        return self.__str__()
+
+    def select(self, logins, cache, max_age):
+        """Given logins, the .tributors cache and a maximum age in days,
+        return the logins that are new or need to be refreshed.
+        """
+        now = time.time()
+        selected = []
+        for login in logins:
+            entry = cache.get(login)
+
+            # New entries, and entries with fields marked for refresh
+            if entry is None or any(is_stale(entry, x, "github") for x in entry):
+                selected.append(login)
+                continue
+
+            # A complete entry can't be updated by a profile
+            if all(x in entry for x in self.fields):
+                continue
+            last = self.data["fetched"].get(login)
+            if last is None or now - last > max_age * 86400:
+                selected.append(login)
+
+        bot.info(f"Looking up {len(selected)} of {len(logins)} contributors")
+        return selected
+
+    def fetched(self, login):
+        """Record that a login profile was retrieved now"""
+        self.data["fetched"][login] = time.time()
+
+    def save(self, logins):
+        """Save the state for the current contributors (logins)"""
+        fetched = self.data["fetched"]
+        self.data["fetched"] = {x: fetched[x] for x in logins if x in fetched}
+        if not self.filename:
+            return
+        states = {}
+        if os.path.exists(self.filename):
+            states = read_json(self.filename)
+        states[self.uid] = self.data
+        write_json(states, self.filename)
+
+
 def get_topics(repo):
     """Given a repository, get topics associated."""
     repo = get_repo(repo) or {}
@@ -157,10 +287,9 @@ def get_repo(repo):
     """get_repo will return a single repo, username/reponame
     given authentication with user
     """
-    headers = get_headers()
-    headers["Accept"] = "application/vnd.github.mercy-preview+json"
+    headers = {"Accept": "application/vnd.github.mercy-preview+json"}
     url = "https://api.github.com/repos/%s" % repo
-    response = requests.get(url, headers=headers)
+    response = http.get(url, headers=headers, cache=True)
 
     # Case 2: public and private
     if response.status_code != 200:
@@ -170,48 +299,68 @@ def get_repo(repo):
     return response.json()
 
 
-def get_contributors(repo):
+def get_contributors(repo, workers=DEFAULT_WORKERS):
     """Given a GitHub repository address, retrieve a lookup of contributors
     from the API endpoint. We look to use the GITHUB_TOKEN if exported
-    to the environment, and exit if the response has any issue.
+    to the environment, and exit if the response has any issue. We ask
+    for the maximum page size, and the first response tells us the last
+    page, so the remaining pages can be retrieved in parallel. Each
+    contributor is kept as a (compact) Contributor record.
     """
     if not repo:
         sys.exit("A repository is required to get contributors.")
     url = "https://api.github.com/repos/%s/contributors" % repo
-    headers = get_headers()
-    page = 1
-    contributors = {}
-    while True:
-        paginated_url = "%s?page=%s" % (url, page)
-        bot.debug(paginated_url)
-        response = requests.get(paginated_url, headers=headers)
-        if response.status_code != 200:
-            message = "Response %s from GitHub: %s, cannot retrieve contributors " % (
-                response.status_code,
-                response.reason,
-            )
-            if not os.environ.get("GITHUB_TOKEN"):
-                message += " you should export GITHUB_TOKEN to increase your API limits"
-            sys.exit(message)
-        new_contributors = {x["login"]: x for x in response.json()}
 
-        # This is the signal for we don't have any more pages
-        if not new_contributors:
-            break
-        contributors.update(new_contributors)
-        page += 1
+    response = get_contributors_page(url, 1)
+    contributors = {x.login: x for x in parse_contributors(response)}
+
+    # The Link header is only present if there is more than one page
+    last = get_last_page(response)
+    pages = parallel_map(
+        lambda page: parse_contributors(get_contributors_page(url, page)),
+        range(2, last + 1),
+        workers=workers,
+    )
+    for page in pages:
+        contributors.update({x.login: x for x in page})
 
     # Return a lookup based on GitHub Login
     return contributors
 
 
+def get_contributors_page(url, page):
+    """Retrieve a single page of contributors, and exit on any issue"""
+    paginated_url = "%s?per_page=%s&page=%s" % (url, PER_PAGE, page)
+    bot.debug(paginated_url)
+    response = http.get(paginated_url, cache=True)
+    if response.status_code != 200:
+        message = "Response %s from GitHub: %s, cannot retrieve contributors " % (
+            response.status_code,
+            response.reason,
+        )
+        if not os.environ.get("GITHUB_TOKEN"):
+            message += " you should export GITHUB_TOKEN to increase your API limits"
+        sys.exit(message)
+    return response
+
+
+def parse_contributors(response):
+    """Parse a page of contributors into Contributor records"""
+    return [Contributor.from_github(x) for x in response.json()]
+
+
+def get_last_page(response):
+    """Given a paginated response, return the number of the last page"""
+    last = response.links.get("last", {}).get("url")
+    if not last:
+        return 1
+    page = parse_qs(urlparse(last).query).get("page", ["1"])
+    return int(page[0])
+
+
 def get_headers():
     """Get headers, including a Github token if found in the environment"""
-    token = os.environ.get("GITHUB_TOKEN")
-    headers = {"Accept": "application/vnd.github.v3+json"}
-    if token:
-        headers["Authorization"] = "token %s" % token
-    return headers
+    return http.get_host_headers("api.github.com")
 
 
 def get_user(username):
@@ -219,16 +368,73 @@ def get_user(username):
     this to get the profile (blog) url from the metadata
     """
     url = "https://api.github.com/users/%s" % username
-    headers = get_headers()
-    response = requests.get(url, headers=headers)
+    response = http.get(url, cache=True)
+
+    # Rate limits are already retried, so don't throw away work done so far
     if response.status_code != 200:
-        sys.exit(
+        bot.warning(
             "Response %s: %s, cannot retrieve GitHub user %s."
             % (response.status_code, response.reason, username)
         )
+        return {}
     return response.json()
 
 
+def get_users(logins, workers=DEFAULT_WORKERS):
+    """Given a list of usernames, retrieve user metadata in the same order.
+    With a GITHUB_TOKEN we can ask the GraphQL API for up to GRAPHQL_BATCH
+    users at once, otherwise we fall back to one REST call per user.
+    """
+    logins = list(logins)
+    users = {}
+    if os.environ.get("GITHUB_TOKEN"):
+        batches = [
+            logins[i : i + GRAPHQL_BATCH] for i in range(0, len(logins), GRAPHQL_BATCH)
+        ]
+        for batch in parallel_map(get_users_graphql, batches, workers=workers):
+            users.update(batch)
+
+    # Anyone not found with GraphQL is retrieved with the REST API
+    missing = [x for x in logins if x not in users]
+    users.update(zip(missing, parallel_map(get_user, missing, workers=workers)))
+    return [users[login] for login in logins]
+
+
+def get_users_graphql(logins):
+    """Retrieve a batch of users with one GraphQL query, using an alias
+    for each user. Fields are renamed to match the REST API, and a user
+    that isn't found (or a failed query) is left out of the result.
+    """
+    selections = [
+        "u%s: user(login: %s) { login name email bio websiteUrl }"
+        % (i, json.dumps(login))
+        for i, login in enumerate(logins)
+    ]
+    query = "query {\n  %s\n}" % "\n  ".join(selections)
+    response = http.post("https://api.github.com/graphql", json={"query": query})
+    if response.status_code != 200:
+        bot.warning(
+            f"Response {response.status_code} from GitHub GraphQL: {response.reason}, "
+            "falling back to REST."
+        )
+        return {}
+
+    data = response.json().get("data") or {}
+    users = {}
+    for i, login in enumerate(logins):
+        user = data.get("u%s" % i)
+        if not user:
+            continue
+        users[login] = {
+            "login": user["login"],
+            "name": user["name"],
+            "email": user["email"],
+            "bio": user["bio"],
+            "blog": user["websiteUrl"],
+        }
+    return users
+
+
 def get_github_repository(repo):
     """First preference goes to repo variable provided, then check the environment,
     and then check for a local .git repo. Finally, verify that format is
@@ -238,13 +444,7 @@ def get_github_repository(repo):
         return repo.uid
     repo = repo or os.environ.get("GITHUB_REPOSITORY")
     if not repo:
-        command = Command("git config --get remote.origin.url")
-        command.execute()
-
-        # Issue running command
-        if command.returncode != 0 or not command.out:
-            sys.exit("Could not determine repository from local .git.")
-        repo = "/".join(command.out[0].strip().split("/")[-2:])
+        repo = get_local_repository(os.getcwd())
 
     match = re.search(repository_regex, repo)
 
@@ -253,3 +453,17 @@ def get_github_repository(repo):
         sys.exit("Malformed repository address %s" % repo)
     owner, repo = match.groups()
     return "%s/%s" % (owner, re.sub(".git$", "", repo, 1))
+
+
+@functools.lru_cache(maxsize=None)
+def get_local_repository(path):
+    """Get the repository from the remote of a local .git. The result is
+    kept for the path, so we only run git once.
+    """
+    command = Command("git config --get remote.origin.url")
+    command.execute()
+
+    # Issue running command
+    if command.returncode != 0 or not command.out:
+        sys.exit("Could not determine repository from local .git.")
+    return "/".join(command.out[0].strip().split("/")[-2:])
@@ -0,0 +1,545 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from tributors.utils.file import get_cache_dir, read_json, write_json
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import hashlib
+import logging
+import os
+import random
+import requests
+import threading
+import time
+
+bot = logging.getLogger("http")
+
+# Default (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+# Default number of keep-alive connections kept per host
+DEFAULT_POOL_SIZE = 10
+
+# Default maximum size (in bytes) of the response cache
+DEFAULT_CACHE_SIZE = 50 * 1024 * 1024
+
+# Response headers that are kept with a cached response
+CACHED_HEADERS = ["Content-Type", "ETag", "Last-Modified", "Link"]
+
+# Default number of times a throttled or failed request is retried
+DEFAULT_RETRIES = 5
+
+# Default longest time (in seconds) we are willing to wait for a rate limit reset
+DEFAULT_MAX_WAIT = 3600
+
+# Server errors that are considered transient
+TRANSIENT_STATUSES = [500, 502, 503, 504]
+
+# Default requests per second (and burst) for the ORCID public API
+DEFAULT_ORCID_RATE = 24
+DEFAULT_ORCID_BURST = 40
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_timeout():
+    """Get the (connect, read) timeout, optionally from TRIBUTORS_TIMEOUT.
+    The variable can be a single number (used for both) or connect,read
+    """
+    timeout = os.environ.get("TRIBUTORS_TIMEOUT")
+    if not timeout:
+        return DEFAULT_TIMEOUT
+    parts = [float(x) for x in timeout.split(",")]
+    if len(parts) == 1:
+        return (parts[0], parts[0])
+    return tuple(parts[:2])
+
+
+def get_host_headers(host):
+    """Get default headers for a host, including authentication if a
+    token for the service is found in the environment.
+    """
+    headers = {"Accept": "application/json"}
+    if host == "api.github.com":
+        headers["Accept"] = "application/vnd.github.v3+json"
+        token = os.environ.get("GITHUB_TOKEN")
+        if token:
+            headers["Authorization"] = "token %s" % token
+    elif host == "zenodo.org":
+        token = os.environ.get("ZENODO_TOKEN")
+        if token:
+            headers["Authorization"] = "Bearer %s" % token
+    return headers
+
+
+class ResponseCache:
+    """A response cache stores the body of GET responses on disk along with
+    the ETag / Last-Modified validators. A later request for the same url
+    (and the same credentials) is made conditional, and when the server
+    says 304 Not Modified we serve the stored body. Entries are evicted
+    least recently used first when the cache grows beyond max_size.
+    Responses to authenticated requests (which can include private data)
+    are only stored if authenticated is True. The cache is only readable
+    by the user.
+    """
+
+    def __init__(self, cache_dir=None, max_size=None, authenticated=False):
+        self.cache_dir = cache_dir or get_cache_dir("http")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.chmod(self.cache_dir, 0o700)
+        self.max_size = max_size or int(
+            os.environ.get("TRIBUTORS_HTTP_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+        )
+        self.authenticated = authenticated
+        self.lock = threading.Lock()
+        self._size = None
+
+    def __str__(self):
+        return "[response-cache][%s]" % self.cache_dir
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_path(self, url, headers):
+        """Get the cache file for a url, keyed by url and auth identity. We
+        only store a hash of the credentials, never the credentials.
+        """
+        identity = "%s\n%s\n%s" % (
+            url,
+            headers.get("Accept", ""),
+            hashlib.sha256(headers.get("Authorization", "").encode("utf8")).hexdigest(),
+        )
+        key = hashlib.sha256(identity.encode("utf8")).hexdigest()
+        return os.path.join(self.cache_dir, "%s.json" % key)
+
+    def stores(self, headers):
+        """Determine if responses to a request with headers are stored"""
+        return self.authenticated or "Authorization" not in headers
+
+    def load(self, url, headers):
+        """Load a cached entry, or None if we don't have one"""
+        if not self.stores(headers):
+            return
+        path = self.get_path(url, headers)
+        if not os.path.exists(path):
+            return
+        try:
+            return read_json(path)
+        except (OSError, ValueError):
+            return
+
+    def validators(self, entry):
+        """Given a cached entry, return headers for a conditional request"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def save(self, url, headers, response):
+        """Save a successful response if it can be revalidated later"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+        if not self.stores(headers):
+            return
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": {
+                k: response.headers[k] for k in CACHED_HEADERS if k in response.headers
+            },
+            "content": response.text,
+        }
+        path = self.get_path(url, headers)
+        write_json(entry, path, pretty=False, mode=0o600)
+
+        with self.lock:
+            self._size = self.size + os.path.getsize(path)
+            if self._size > self.max_size:
+                self.evict()
+
+    def touch(self, url, headers):
+        """Mark an entry as recently used"""
+        path = self.get_path(url, headers)
+        if os.path.exists(path):
+            os.utime(path)
+
+    def response(self, entry, response):
+        """Given a cached entry and a 304 response, return a response that
+        looks like the original 200.
+        """
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.reason = "OK"
+        cached.url = entry["url"]
+        cached.request = response.request
+        cached.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        cached.headers.update(
+            {k: v for k, v in response.headers.items() if k.startswith("X-RateLimit")}
+        )
+        cached.encoding = "utf-8"
+        cached._content = entry["content"].encode("utf-8")
+        cached.from_cache = True
+        return cached
+
+    @property
+    def size(self):
+        """The total size of the cache, calculated once and then tracked"""
+        if self._size is None:
+            self._size = sum(
+                os.path.getsize(os.path.join(self.cache_dir, x))
+                for x in os.listdir(self.cache_dir)
+                if x.endswith(".json")
+            )
+        return self._size
+
+    def evict(self):
+        """Remove least recently used entries until we are under 90% of the
+        maximum size. The caller is expected to hold the lock.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(x[1] for x in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        bot.debug(f"Evicted response cache entries, size is now {size}")
+        self._size = size
+
+
+class RateLimitScheduler:
+    """A rate limit scheduler keeps track of the request budget that a host
+    reports (X-RateLimit-Remaining, X-RateLimit-Reset) for each resource
+    (X-RateLimit-Resource, e.g., core, search or graphql for GitHub), since
+    each resource has a separate budget. Before a request it
+    slows down as the budget runs low, and waits for the reset when it is
+    exhausted. After a request it decides if (and how long) to back off
+    before a retry: until the reset or Retry-After for rate limits, and
+    exponentially with jitter for secondary limits and server errors.
+    """
+
+    def __init__(self, retries=None, max_wait=None):
+        self.retries = (
+            retries
+            if retries is not None
+            else int(os.environ.get("TRIBUTORS_RETRIES", DEFAULT_RETRIES))
+        )
+        self.max_wait = max_wait or float(
+            os.environ.get("TRIBUTORS_MAX_WAIT", DEFAULT_MAX_WAIT)
+        )
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return "[rate-limit-scheduler]"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def remaining(self, host, resource=None):
+        """Return the last known budget for a resource of a host (limit,
+        remaining, reset) or None if the host has not reported one.
+        """
+        with self.lock:
+            limits = self.limits.get((host, resource))
+            return dict(limits) if limits else None
+
+    def update(self, host, response, resource=None):
+        """Update the known budget for a resource of a host from a response.
+        The resource the response reports takes precedence.
+        """
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        resource = response.headers.get("X-RateLimit-Resource", resource)
+        with self.lock:
+            self.limits[(host, resource)] = {
+                "limit": int(response.headers.get("X-RateLimit-Limit", 0)),
+                "remaining": int(remaining),
+                "reset": int(reset),
+            }
+
+    def wait(self, host, resource=None):
+        """Before a request, wait for the reset if the budget is used up, or
+        spread the remaining requests until the reset once less than 10%
+        of the budget is left.
+        """
+        limits = self.remaining(host, resource)
+        if not limits:
+            return
+        until_reset = limits["reset"] - time.time()
+        if until_reset <= 0 or limits["remaining"] > limits["limit"] * 0.1:
+            return
+        delay = until_reset + 1
+        if limits["remaining"] > 0:
+            delay = until_reset / limits["remaining"]
+        else:
+            bot.warning(f"Rate limit for {host} is exhausted, waiting {delay:.0f}s")
+        time.sleep(min(delay, self.max_wait))
+
+    def backoff(self, response, attempt):
+        """Given a response, return the number of seconds to wait before a
+        retry, or None if the response should not be retried.
+        """
+        status = response.status_code
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None and status in [403, 429] + TRANSIENT_STATUSES:
+            return retry_after
+
+        # Primary rate limit, wait until the reset
+        if (
+            status in [403, 429]
+            and response.headers.get("X-RateLimit-Remaining") == "0"
+            and response.headers.get("X-RateLimit-Reset")
+        ):
+            return max(int(response.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+
+        # Secondary rate limits ask us to wait at least a minute
+        if status == 403 and "secondary rate limit" in response.text.lower():
+            return jitter(60 * 2**attempt)
+
+        if status == 429 or status in TRANSIENT_STATUSES:
+            return jitter(2**attempt)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header, either a number of seconds or an HTTP date,
+    into the number of seconds to wait (None if missing or invalid).
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_resource(url):
+    """Get the rate limit resource a request to a url uses, for hosts that
+    have more than one budget (GitHub), otherwise None.
+    """
+    url = urlparse(url)
+    if url.netloc != "api.github.com":
+        return None
+    if url.path.startswith("/graphql"):
+        return "graphql"
+    if url.path.startswith("/search/code"):
+        return "code_search"
+    if url.path.startswith("/search"):
+        return "search"
+    return "core"
+
+
+class TokenBucket:
+    """A token bucket limits requests to a host to rate per second, allowing
+    bursts of up to burst requests. It is shared by all threads, and a
+    request waits until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return "[token-bucket][%s/s]" % self.rate
+
+    def __repr__(self):
+        return self.__str__()
+
+    def acquire(self):
+        """Take a token, waiting until one is available"""
+        with self.lock:
+            current = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (current - self.updated) * self.rate
+            )
+            self.updated = current
+
+            # Reserve the token now, and wait for it outside of the lock
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def get_limiters():
+    """Get the token buckets for hosts that limit requests per second. The
+    ORCID public API limits can be set with TRIBUTORS_ORCID_RATE and
+    TRIBUTORS_ORCID_BURST.
+    """
+    return {
+        "pub.orcid.org": TokenBucket(
+            float(os.environ.get("TRIBUTORS_ORCID_RATE", DEFAULT_ORCID_RATE)),
+            float(os.environ.get("TRIBUTORS_ORCID_BURST", DEFAULT_ORCID_BURST)),
+        )
+    }
+
+
+def jitter(delay):
+    """Randomize a backoff delay so parallel workers don't retry in lockstep"""
+    return random.uniform(delay / 2, delay)
+
+
+def get_response_cache():
+    """Get the response cache set by TRIBUTORS_HTTP_CACHE. By default (true)
+    only responses to requests without credentials are stored, with "all"
+    authenticated responses are stored too, and false disables the cache.
+    """
+    setting = os.environ.get("TRIBUTORS_HTTP_CACHE", "true").lower()
+    if setting in ["0", "false", "no"]:
+        return None
+    return ResponseCache(authenticated=setting == "all")
+
+
+class Transport:
+    """A transport is a single requests session shared by all GitHub, ORCID
+    and Zenodo calls. The session keeps a pool of keep-alive connections
+    per host, and each request is given default headers and a timeout.
+    Hosts with a limiter (e.g., pub.orcid.org) are limited to a request rate.
+    """
+
+    def __init__(
+        self, timeout=None, pool_size=None, cache=None, scheduler=None, limiters=None
+    ):
+        self.timeout = timeout or get_timeout()
+        self.cache = cache
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.limiters = limiters if limiters is not None else get_limiters()
+        self.pool_size = pool_size or int(
+            os.environ.get("TRIBUTORS_POOL_SIZE", DEFAULT_POOL_SIZE)
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __str__(self):
+        return "[transport]"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def request(self, method, url, headers=None, **kwargs):
+        """Perform a request, adding host headers and the default timeout.
+        Headers provided by the caller take precedence. Throttled requests,
+        transient server errors and connection errors are retried.
+        """
+        host = urlparse(url).netloc
+        resource = get_resource(url)
+        request_headers = get_host_headers(host)
+        request_headers.update(headers or {})
+        kwargs.setdefault("timeout", self.timeout)
+
+        retries = self.scheduler.retries
+        limiter = self.limiters.get(host)
+        for attempt in range(retries + 1):
+            self.scheduler.wait(host, resource)
+            if limiter:
+                limiter.acquire()
+            bot.debug(f"{method} {url}")
+            try:
+                response = self.session.request(
+                    method, url, headers=request_headers, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == retries:
+                    raise
+                delay = jitter(2**attempt)
+                bot.warning(f"{e.__class__.__name__} for {host}, retry in {delay:.0f}s")
+                time.sleep(delay)
+                continue
+
+            self.scheduler.update(host, response, resource)
+            delay = self.scheduler.backoff(response, attempt)
+            if delay is None or attempt == retries or delay > self.scheduler.max_wait:
+                return response
+            bot.warning(
+                f"Response {response.status_code} from {host}, retry in {delay:.0f}s"
+            )
+            time.sleep(delay)
+
+    def get(self, url, headers=None, cache=False, **kwargs):
+        """Perform a GET request. If cache is True and we have a response
+        cache, the request is made conditional on a previous response.
+        """
+        if not cache or not self.cache:
+            return self.request("GET", url, headers=headers, **kwargs)
+
+        request_headers = get_host_headers(urlparse(url).netloc)
+        request_headers.update(headers or {})
+        entry = self.cache.load(url, request_headers)
+        conditional = dict(headers or {})
+        if entry:
+            conditional.update(self.cache.validators(entry))
+
+        response = self.request("GET", url, headers=conditional, **kwargs)
+        if entry and response.status_code == 304:
+            bot.debug(f"Not modified, using cached response for {url}")
+            self.cache.touch(url, request_headers)
+            return self.cache.response(entry, response)
+        self.cache.save(url, request_headers, response)
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def get_transport():
+    """Get the process-wide transport, creating it on first use"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport(cache=get_response_cache())
+    return _transport
+
+
+def get(url, **kwargs):
+    """Perform a GET request with the shared transport"""
+    return get_transport().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """Perform a POST request with the shared transport"""
+    return get_transport().post(url, **kwargs)
+
+
+def rate_limit(host="api.github.com", resource="core"):
+    """Return the last known request budget for a resource of a host (limit,
+    remaining and reset) or None if we don't know it yet.
+    """
+    return get_transport().scheduler.remaining(host, resource)
@@ -8,23 +8,69 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 """
 
-from tributors.utils.file import write_file, get_tmpfile
-from tributors.utils.prompt import choice_prompt, entry_prompt
+from tributors.main import http
+from tributors.utils.file import (
+    get_cache_dir,
+    get_tmpfile,
+    read_json,
+    write_file,
+    write_json,
+)
+from tributors.utils.prompt import choice_prompt, entry_prompt, review_prompt
+from tributors.utils.threads import in_context, parallel_map, SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
 import logging
 import os
 import requests
+import threading
+import time
 import urllib
 
 bot = logging.getLogger("github")
 
+# Time to live (in days) for the outcome of an ORCID search
+SEARCH_TTL = {"found": 365, "none": 30, "ambiguous": 14}
+
+# Decisions made for a person in interactive mode (an id chosen or entered,
+# or the results skipped) are kept until the decisions cache is removed.
+DECISION_TTL = {"chosen": None, "entered": None, "skipped": None}
+
+_search_cache = None
+_decision_cache = None
+_search_cache_lock = threading.Lock()
+
+# An orcid id entered by the user
+ORCID_PATTERN = "[0-9]{4}-[0-9]{4}-[0-9]{4}-[0-9]{3}[0-9X]$"
+
+# Responses that mean we are (still) being throttled
+THROTTLED_STATUSES = [429, 503]
+
+# Emails to search for in one query (prefetch_emails), the results to ask
+# for per email, and the longest search url we will use
+EMAIL_BATCH_SIZE = 20
+EMAIL_BATCH_ROWS = 5
+MAX_URL_LENGTH = 2000
+
+# Searches for one person run at the same time (speculative), the others
+# wait their turn and are cancelled once we have an answer
+SPECULATIVE_SEARCHES = 2
+
+# Sections of orcid records that we've retrieved, by orcid id
+sections = SingleFlight()
+
+# Search results for interactive prompts, prefetched in the background
+candidates = SingleFlight()
+
 
 class OrcidIdentifier:
-    """A simple class to retrieve an orcid record, and expose needed fields"""
+    """A simple class to retrieve an orcid record, and expose needed fields.
+    We only retrieve the sections of the record that we need (the person
+    and employments) and only when a field is asked for.
+    """
 
     def __init__(self, orcid):
         self.orcid = orcid
-        self._record = {}
-        self.found = False
 
     def __str__(self):
         if self.orcid:
@@ -35,55 +81,70 @@ class OrcidIdentifier:
         return self.__str__()
 
     @property
-    def record(self):
-        """Given an orcid id, retrieve a record for it"""
-        if not self._record and self.orcid:
-            self.get_record()
-        return self._record
+    def found(self):
+        """Determine if the orcid id has a (public) record"""
+        return self.person is not None
+
+    @property
+    def person(self):
+        """The person section of the record, with names"""
+        return get_record_section(self.orcid, "person")
+
+    @property
+    def employments(self):
+        """The employments section of the record"""
+        return get_record_section(self.orcid, "employments")
 
     @property
     def firstName(self):
-        return (
-            self.record.get("person", {})
-            .get("name", {})
-            .get("given-names", {})
-            .get("value")
-        )
+        return (self.person or {}).get("name", {}).get("given-names", {}).get("value")
 
     @property
     def affiliation(self):
         """We consider the affiliation the most recent employment (top of the list)"""
-        employer = (
-            self.record.get("activities-summary", {})
-            .get("employments", {})
-            .get("employment-summary", [])
-        )
-        if employer:
-            return employer[0].get("organization", {}).get("name")
+        for group in (self.employments or {}).get("affiliation-group", []):
+            for summary in group.get("summaries", []):
+                employer = summary.get("employment-summary", {})
+                return employer.get("organization", {}).get("name")
 
     @property
     def lastName(self):
-        return (
-            self.record.get("person", {})
-            .get("name", {})
-            .get("family-name", {})
-            .get("value")
-        )
+        return (self.person or {}).get("name", {}).get("family-name", {}).get("value")
 
     def get_record(self):
-        if not self.orcid:
-            return
+        """Retrieve the sections of the record we need, e.g., to do it ahead
+        of time in a worker thread.
+        """
+        if self.found:
+            self.employments
 
-        response = requests.get(
-            "https://pub.orcid.org/v2.1/%s/record" % self.orcid,
-            headers={
-                "Accept": "application/json",
-            },
-        )
-        if response.status_code != 200:
-            return
-        self.found = True
-        self._record = response.json()
+
+def get_record_section(orcid, section):
+    """Retrieve a section of an orcid record. Each section is only requested
+    once per orcid id (and process), even for concurrent callers.
+    """
+    if not orcid:
+        return
+    try:
+        return sections.do((orcid, section), _get_record_section, orcid, section)
+    except requests.HTTPError as e:
+        bot.warning(f"Could not retrieve {section} for {orcid}: {e}")
+
+
+def _get_record_section(orcid, section):
+    response = http.get("https://pub.orcid.org/v3.0/%s/%s" % (orcid, section))
+    raise_for_throttle(response)
+    if response.status_code != 200:
+        return
+    return response.json()
+
+
+def raise_for_throttle(response):
+    """Raise an error for a response that is still throttled after retries,
+    so we don't take it to mean there is no result (or record).
+    """
+    if response.status_code in THROTTLED_STATUSES:
+        response.raise_for_status()
 
 
 def get_orcid_token():
@@ -97,9 +158,8 @@ def get_orcid_token():
     orcid_secret = os.environ.get("ORCID_SECRET")
 
     if not orcid_token and orcid_id is not None and orcid_secret is not None:
-        response = requests.post(
+        response = http.post(
             "https://orcid.org/oauth/token",
-            headers={"Accept": "application/json"},
             data={
                 "client_id": orcid_id,
                 "client_secret": orcid_secret,
@@ -130,7 +190,288 @@ def get_orcid_token():
     return orcid_token
 
 
-def record_search(url, terms, interactive=False, search_type=""):
+class SearchCache:
+    """A search cache persists the outcome of ORCID searches, keyed by the
+    normalized query. We also store when a search had no result, or more
+    than one (ambiguous) result, so people we have already resolved or
+    ruled out are not searched again. Each outcome has its own time to
+    live (in days). The same class keeps interactive decisions, which
+    are keyed by the person (a login or email) and the query.
+    """
+
+    def __init__(self, filename=None, ttl=None):
+        self.filename = filename or os.path.join(
+            get_cache_dir("orcid"), "searches.json"
+        )
+        self.ttl = ttl or SEARCH_TTL
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._data = None
+
+    def __str__(self):
+        return "[orcid-search-cache][%s]" % self.filename
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def data(self):
+        """Load the cache on first use"""
+        with self.lock:
+            if self._data is None:
+                self._data = {}
+                if os.path.exists(self.filename):
+                    self._data = read_json(self.filename)
+        return self._data
+
+    def get_key(self, url, person=None):
+        """Normalize the query of a search url (and person) to use as a key"""
+        query = parse_qs(urlparse(url).query).get("q", [""])[0]
+        key = " ".join(query.lower().split())
+        if person:
+            key = "%s %s" % (person.lower(), key)
+        return key
+
+    def get(self, url, person=None):
+        """Get a stored outcome for a search, if it hasn't expired"""
+        entry = self.data.get(self.get_key(url, person))
+        if not entry:
+            return
+        ttl = self.ttl.get(entry["outcome"])
+        if ttl is not None and time.time() - entry["updated"] > ttl * 86400:
+            return
+        return entry
+
+    def set(self, url, outcome, orcid=None, person=None):
+        """Store the outcome of a search (found, none or ambiguous) or a
+        decision about its results for a person (chosen, entered or skipped)
+        """
+        entry = {"outcome": outcome, "updated": time.time()}
+        if orcid:
+            entry["orcid"] = orcid
+        key = self.get_key(url, person)
+        data = self.data
+        with self.lock:
+            data[key] = entry
+            self.dirty = True
+
+    def save(self):
+        """Save the cache, if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            write_json(self._data, self.filename)
+            self.dirty = False
+
+
+def get_search_cache():
+    """Get the process-wide ORCID search cache, creating it on first use"""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache()
+    return _search_cache
+
+
+def get_decision_cache():
+    """Get the process-wide cache of interactive decisions, creating it on
+    first use. It is kept apart from the search cache, which only has the
+    outcomes of searches and is shared by everyone with the same name.
+    """
+    global _decision_cache
+    with _search_cache_lock:
+        if _decision_cache is None:
+            _decision_cache = SearchCache(
+                os.path.join(get_cache_dir("orcid"), "decisions.json"),
+                ttl=DECISION_TTL,
+            )
+    return _decision_cache
+
+
+def get_decision(url, person):
+    """Get the decision made about a search for a person, if there is one"""
+    if person:
+        return get_decision_cache().get(url, person)
+
+
+def set_decision(url, person, outcome, orcid=None):
+    """Keep a decision about a search for a person. Without a person (e.g.,
+    only a name) we can't tell who it was for, so it is not kept.
+    """
+    if person:
+        get_decision_cache().set(url, outcome, orcid, person=person)
+
+
+def save_caches():
+    """Save the search and decision caches, if anything changed"""
+    get_search_cache().save()
+    get_decision_cache().save()
+
+
+def get_search_results(url):
+    """Do a search, and store the outcome (found, none or ambiguous) in the
+    search cache. Returns None if the search failed.
+    """
+    cache = get_search_cache()
+    response = http.get(url)
+    raise_for_throttle(response)
+    if response.status_code != 200:
+        return
+
+    results = response.json().get("expanded-result", []) or []
+    if not results:
+        cache.set(url, "none")
+    elif len(results) == 1:
+        cache.set(url, "found", results[0]["orcid-id"])
+    else:
+        cache.set(url, "ambiguous")
+    return results
+
+
+def prefetch_search(url, done=None):
+    """Do a search in advance (if we don't know its outcome) so the outcome
+    is in the search cache when record_search gets to it. If done is set
+    (e.g., we have an answer) the search isn't needed anymore.
+    """
+    if done is not None and done.is_set():
+        return
+    if get_search_cache().get(url) is None:
+        get_search_results(url)
+
+
+def prefetch_candidates(people, workers=2):
+    """Given a list of (email, name, person) for people we will prompt about,
+    run their searches in the background (in order) so the results are ready
+    for the prompt. Returns the executor, to shut down when we are done.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for email, name, person in people:
+        executor.submit(in_context(_prefetch_candidates), email, name, person)
+    return executor
+
+
+def _prefetch_candidates(email, name, person=None):
+    """Run the searches for one person that we may prompt about, stopping
+    at a search with a single result, or a decision.
+    """
+    cache = get_search_cache()
+    for search_args, _, _ in gen_searches(email, name):
+        url = extended_search_url(*search_args)
+        decided = get_decision(url, person or email)
+        if decided is not None:
+            if decided.get("orcid"):
+                return
+            continue
+        cached = cache.get(url)
+        if cached is not None and cached["outcome"] != "ambiguous":
+            if cached.get("orcid"):
+                return
+            continue
+        try:
+            results = candidates.do(url, get_search_results, url)
+        except requests.RequestException:
+            return
+        if results and len(results) == 1:
+            return
+
+
+def format_result(r):
+    """Format a search result to show to the user"""
+    record = "  Name: %s, %s\n  ORCID: %s (https://orcid.org/%s)" % (
+        r["family-names"],
+        r["given-names"],
+        r["orcid-id"],
+        r["orcid-id"],
+    )
+    if r["institution-name"]:
+        record = "%s\n  Institutions: %s" % (
+            record,
+            ", ".join(r["institution-name"]),
+        )
+    if r["other-name"]:
+        record = "%s\n  Other Names: %s" % (record, ", ".join(r["other-name"]))
+    if r["email"]:
+        record = "%s\n  Email: %s" % (record, r["email"])
+    return record
+
+
+def get_candidates(email, name, person=None):
+    """Find the first search for a person with more than one result that we
+    haven't decided about. Returns the url, terms and (up to 10) results,
+    or None if there is nothing to review.
+    """
+    cache = get_search_cache()
+    for search_args, _, _ in gen_searches(email, name):
+        url = extended_search_url(*search_args)
+        decided = get_decision(url, person or email)
+        if decided is not None:
+            if decided.get("orcid"):
+                return
+            continue
+        cached = cache.get(url)
+        if cached is not None and cached["outcome"] != "ambiguous":
+            if cached.get("orcid"):
+                return
+            continue
+
+        # A search that failed (or was throttled) leaves the person for later
+        try:
+            results = get_search_results(url)
+        except requests.RequestException as e:
+            bot.warning(f"ORCID search for {email or name} did not finish: {e}")
+            return
+        if results is None or len(results) == 1:
+            return
+        if results:
+            return url, search_args[0] % search_args[1:], results[:10]
+
+
+def record_decision(url, results, decision, person=None):
+    """Keep a decision from a review (see review_prompt) for a person, and
+    return the orcid id that was chosen or entered.
+    """
+    if not decision:
+        return
+    action, value = decision
+    if action == "skip":
+        set_decision(url, person, "skipped")
+        return
+    if action == "enter":
+        set_decision(url, person, "entered", value)
+        return value
+    orcid_id = results[value]["orcid-id"]
+    set_decision(url, person, "chosen", orcid_id)
+    return orcid_id
+
+
+def review_orcids(people, workers=1):
+    """Given a list of (email, name, person) for people without an orcid id,
+    find the ones with more than one candidate and review them all at once.
+    The person (a login, or the email if not given) keys the decisions.
+    Returns the orcid id (or None) for each person.
+    """
+    found = parallel_map(lambda person: get_candidates(*person), people, workers)
+    reviews = [(idx, x) for idx, x in enumerate(found) if x]
+    orcids = [None] * len(people)
+    if not reviews:
+        bot.info("There are no ORCID searches with more than one result to review.")
+        return orcids
+
+    items = [
+        {"title": terms, "options": [format_result(r) for r in results]}
+        for _, (_, terms, results) in reviews
+    ]
+    decisions = review_prompt(items, regex=ORCID_PATTERN)
+    try:
+        for (idx, (url, _, results)), decision in zip(reviews, decisions):
+            email, _, person = people[idx]
+            orcids[idx] = record_decision(url, results, decision, person or email)
+    finally:
+        save_caches()
+    return orcids
+
+
+def record_search(url, terms, interactive=False, search_type="", person=None):
     """Given a url (with a name or terms) do a record search looking for an orcid id.
 
     Arguments:
@@ -138,13 +479,33 @@ def record_search(url, terms, interactive=False, search_type=""):
       - terms (str) : terms, used just for logging
       - interactive (bool) : if True, ask user if there is more than a single response
       - search_type (str) : description on what search is based on, used just for logging
+      - person (str) : the login or email of the person, to keep decisions for
     """
-    response = requests.get(url, headers={"Accept": "application/json"})
-    if response.status_code != 200:
-        return
+    term_str = terms[0] % terms[1:]
 
-    results = response.json().get("expanded-result", []) or []
+    # A decision made for this person is used, with or without prompts
+    decided = get_decision(url, person)
+    if decided is not None:
+        return decided.get("orcid")
+
+    # Outcomes we found before are used, unless we need to prompt the user
+    cache = get_search_cache()
+    cached = cache.get(url)
+    if cached is not None and not (cached["outcome"] == "ambiguous" and interactive):
+        if cached["outcome"] == "ambiguous":
+            bot.info(
+                f"{term_str}: found more than one result for ORCID search {search_type} "
+                "(cached), run with --interactive mode to select."
+            )
+            return Ellipsis
+        return cached.get("orcid")
 
+    # Results for a prompt may have been prefetched while we were waiting
+    if interactive:
+        results = candidates.do(url, get_search_results, url)
+        candidates.forget(url)
+    else:
+        results = get_search_results(url)
     if not results:
         return
 
@@ -152,7 +513,6 @@ def record_search(url, terms, interactive=False, search_type=""):
     if len(results) == 1:
         return results[0]["orcid-id"]
 
-    term_str = terms[0] % terms[1:]
     # Only stream results to screen in interactive mode
     if not interactive:
         bot.info(
@@ -172,30 +532,14 @@ def record_search(url, terms, interactive=False, search_type=""):
         if idx > 10:
             break
 
-        record = "  Name: %s, %s\n  ORCID: %s (https://orcid.org/%s)" % (
-            r["family-names"],
-            r["given-names"],
-            r["orcid-id"],
-            r["orcid-id"],
-        )
-        if r["institution-name"]:
-            record = "%s\n  Institutions: %s" % (
-                record,
-                ", ".join(r["institution-name"]),
-            )
-        if r["other-name"]:
-            record = "%s\n  Other Names: %s" % (record, ", ".join(r["other-name"]))
-        if r["email"]:
-            record = "%s\n  Email: %s" % (record, r["email"])
+        record = format_result(r)
         if not interactive:
             print("%s\n" % record)
         else:
             print("[%s]\n%s\n" % (idx, record))
 
-    # TODO: here we should remember for a person on what we already presented as
-    # options and not to show them again.
-    #
-    # If interactive, ask for choice prompt
+    # If interactive, ask for choice prompt. The decision is kept for the
+    # person so we don't ask again.
     if interactive:
         skip_choices = ["s", "S", "skip"]
         enter_choices = ["e", "E", "enter"]
@@ -219,16 +563,21 @@ def record_search(url, terms, interactive=False, search_type=""):
             raise StopIteration("Requested by user")
 
         if choice in enter_choices:
-            return entry_prompt(
+            orcid_id = entry_prompt(
                 f"Please enter the ORCID for {term_str}.",
-                regex="[0-9]{4}-[0-9]{4}-[0-9]{4}-[0-9]{3}[0-9X]$",
+                regex=ORCID_PATTERN,
             )
+            set_decision(url, person, "entered", orcid_id)
+            return orcid_id
 
         if not choice or choice in skip_choices:
+            set_decision(url, person, "skipped")
             return
 
         # Return the orcid identifier
-        return results[int(choice) - 1]["orcid-id"]
+        orcid_id = results[int(choice) - 1]["orcid-id"]
+        set_decision(url, person, "chosen", orcid_id)
+        return orcid_id
 
 
 def extended_search_url(q, *args):
@@ -240,6 +589,78 @@ def extended_search_url(q, *args):
     return url
 
 
+def batch_search_url(emails):
+    """Search url for any of a list of emails, requesting enough rows for
+    each email to have a few results.
+    """
+    q = "+OR+".join("email:%s" % urllib.parse.quote(email) for email in emails)
+    rows = min(EMAIL_BATCH_ROWS * len(emails), 1000)
+    return f"https://pub.orcid.org/v3.0/expanded-search?q={q}&rows={rows}"
+
+
+def batch_emails(emails, size=None, max_length=None):
+    """Split emails into batches of at most size emails, where the search
+    url for each batch is at most max_length characters.
+    """
+    size = size or EMAIL_BATCH_SIZE
+    max_length = max_length or MAX_URL_LENGTH
+    batch = []
+    for email in emails:
+        if batch and (
+            len(batch) == size or len(batch_search_url(batch + [email])) > max_length
+        ):
+            yield batch
+            batch = []
+        batch.append(email)
+    if batch:
+        yield batch
+
+
+def prefetch_emails(emails):
+    """Search for many emails with one query per batch, and store the outcome
+    for each email in the search cache, under the same key as a search for
+    the single email. Emails with more than one match (or when a batch has
+    too many results to tell) are left for a single search.
+    """
+    cache = get_search_cache()
+    todo = {}
+    for email in emails:
+        if email and cache.get(extended_search_url("email:%s", email)) is None:
+            todo.setdefault(email.lower(), email)
+    if len(todo) < 2:
+        return
+
+    for batch in batch_emails(list(todo.values())):
+        url = batch_search_url(batch)
+        response = http.get(url)
+        if response.status_code != 200:
+            continue
+
+        results = response.json().get("expanded-result", []) or []
+        if len(results) >= min(EMAIL_BATCH_ROWS * len(batch), 1000):
+            bot.debug(f"Too many results to resolve a batch of {len(batch)} emails.")
+            continue
+
+        # A result we can't match to an email means we can't rule any out
+        matches = {}
+        unmatched = False
+        for result in results:
+            emails = [x.lower() for x in result.get("email") or []]
+            unmatched = unmatched or not any(x in todo for x in emails)
+            for email in emails:
+                matches.setdefault(email, set()).add(result["orcid-id"])
+
+        for email in batch:
+            orcids = matches.get(email.lower(), set())
+            single = extended_search_url("email:%s", email)
+            if not orcids and not unmatched:
+                cache.set(single, "none")
+            elif len(orcids) == 1:
+                cache.set(single, "found", orcids.pop())
+        bot.debug(f"Searched {len(batch)} emails with {url}")
+    cache.save()
+
+
 strict, loose = True, False
 
 
@@ -299,20 +720,63 @@ def gen_searches(email, name):
         )
 
 
-def get_orcid(email: str | None, name: str | None = None, interactive=False):
-    """Get an orcid identifier for a given email or name."""
+def get_orcid(
+    email: str | None,
+    name: str | None = None,
+    interactive=False,
+    speculative=False,
+    person: str | None = None,
+):
+    """Get an orcid identifier for a given email or name. Decisions made in
+    interactive mode are kept for the person (a login, or the email).
+    """
     # We must have an email OR name
     if not email and not name:
         return
 
-    for search_args, search_desc, strictness in gen_searches(email, name):
-        url = extended_search_url(*search_args)
-        if (
-            orcid_id := record_search(url, search_args, interactive, search_desc)
-        ) is not Ellipsis and orcid_id:
-            return orcid_id
-        if orcid_id is Ellipsis:
-            orcid_id = None
-            if strict:
-                break
-        # if loose, and still got multiple results, continue
+    try:
+        return search_orcid(email, name, interactive, speculative, person or email)
+    except requests.HTTPError as e:
+        bot.warning(f"ORCID search for {email or name} did not finish: {e}")
+
+
+def search_orcid(email, name, interactive=False, speculative=False, person=None):
+    """Run searches for an orcid identifier in order of preference. If
+    speculative (and not interactive) up to SPECULATIVE_SEARCHES searches
+    run at once, and we still use the first definitive answer in order of
+    preference. Searches that haven't started when we have an answer are
+    cancelled.
+    """
+    searches = list(gen_searches(email, name))
+    executor = None
+    futures = []
+    done = threading.Event()
+    if speculative and not interactive and len(searches) > 1:
+        executor = ThreadPoolExecutor(max_workers=SPECULATIVE_SEARCHES)
+        futures = [
+            executor.submit(
+                in_context(prefetch_search), extended_search_url(*search_args), done
+            )
+            for search_args, _, _ in searches
+        ]
+
+    try:
+        for idx, (search_args, search_desc, strictness) in enumerate(searches):
+            if futures:
+                futures[idx].result()
+            url = extended_search_url(*search_args)
+            if (
+                orcid_id := record_search(
+                    url, search_args, interactive, search_desc, person
+                )
+            ) is not Ellipsis and orcid_id:
+                return orcid_id
+            if orcid_id is Ellipsis:
+                orcid_id = None
+                if strict:
+                    break
+            # if loose, and still got multiple results, continue
+    finally:
+        done.set()
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
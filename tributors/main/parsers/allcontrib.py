@@ -15,6 +15,8 @@ import os
 import sys
 
 from tributors.main.github import GitHubRepository
+from tributors.main.cache import needs_update, set_field
+from tributors.main.contributor import Contributor
 from tributors.utils.file import write_json
 from .base import ParserBase
 
@@ -23,6 +25,7 @@ bot = logging.getLogger("allcontrib")
 
 class AllContribParser(ParserBase):
     name = "allcontrib"
+    keys = {"login": "login", "name": "name"}
 
     # https://allcontributors.org/docs/en/emoji-key
     contribution_types = [
@@ -68,16 +71,15 @@ class AllContribParser(ParserBase):
 
     @property
     def login_lookup(self):
+        """Return loaded metadata as a github login lookup."""
         self.load_data()
-        return {
-            x["login"]: x for x in self.data.get("contributors", []) if "login" in x
-        }
+        return self.get_contributors("contributors").lookup("login")
 
     @property
     def name_lookup(self):
         """Return loaded metadata as an name lookup."""
         self.load_data()
-        return {x["name"]: x for x in self.data.get("contributors", []) if "name" in x}
+        return self.get_contributors("contributors").lookup("name")
 
     def init(self, force=False, from_resources=None, save=True):
         """Given an allcontributors file (we default to the one expected) and
@@ -181,26 +183,19 @@ class AllContribParser(ParserBase):
             if not self.include_contributor(login):
                 continue
 
-            cache = self.cache.get(login) or {}
+            person = Contributor.from_cache(login, self.cache.get(login) or {})
+            person.fill(self.repo.contributors.get(login))
             if login in self.login_lookup:
                 entry = self.login_lookup[login]
             else:
                 bot.info(f"⭐️ Found new contributor {login} in {self.filename}")
-                entry = {
-                    "login": login,
-                    "name": cache.get("name") or login,
-                    "contributions": [ctype],
-                }
+                entry = person.to_allcontrib(ctype)
 
-            # Only add profile and profile if not added yet
+            # Only add profile and avatar if not added yet
             if "profile" not in entry:
-                entry["profile"] = cache.get("blog") or self.repo.contributors.get(
-                    login, {}
-                ).get("html_url")
+                entry["profile"] = person.blog or person.html_url
             if "avatar_url" not in entry:
-                entry["avatar_url"] = (
-                    self.repo.contributors.get(login, {}).get("avatar_url"),
-                )
+                entry["avatar_url"] = person.avatar_url
 
             if ctype not in entry["contributions"]:
                 entry["contributions"].append(ctype)
@@ -222,10 +217,10 @@ class AllContribParser(ParserBase):
             else:
                 entry = {}
                 bot.info(f"⭐️ Found new contributor {login} in {self.filename}")
-            if "name" not in entry and "name" in metadata:
-                entry["name"] = metadata["name"]
+            if needs_update(entry, "name", self.name) and "name" in metadata:
+                set_field(entry, "name", metadata["name"], self.name)
                 bot.info(f"   Updating {login} with name: {entry['name']}")
-            if "blog" not in entry and "profile" in metadata:
-                entry["blog"] = metadata["profile"]
+            if needs_update(entry, "blog", self.name) and "profile" in metadata:
+                set_field(entry, "blog", metadata["profile"], self.name)
                 bot.info(f"   Updating {login} with blog: {entry['blog']}")
             self.cache[login] = entry
@@ -8,8 +8,25 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 """
 
-from tributors.main.orcid import get_orcid, OrcidIdentifier
+from tributors.main.cache import (
+    is_stale,
+    needs_update,
+    revalidate,
+    set_field,
+    TributorsCache,
+)
+from tributors.main.contributor import ContributorList
+from tributors.main.orcid import (
+    candidates,
+    get_orcid,
+    prefetch_candidates,
+    prefetch_emails,
+    review_orcids,
+    save_caches,
+    OrcidIdentifier,
+)
 from tributors.utils.file import read_json
+from tributors.utils.threads import parallel_map, DEFAULT_WORKERS
 
 import logging
 import os
@@ -25,11 +42,14 @@ class ParserBase:
 
     name = "base"
 
+    # Keys to index the contributors of the file format by
+    keys = {}
+
     def __init__(self, filename=None, repo=None, params=None):
         """initialize a new contributor parser."""
         self.filename = filename
         self._repo = repo
-        self.cache = {}
+        self.cache = TributorsCache()
         self.contributors = {}
         self.thresh = 1
         self.params = params or {}
@@ -65,6 +85,17 @@ class ParserBase:
         """Return loaded metadata as a github login lookup."""
         return {}
 
+    @property
+    def cache(self):
+        """The shared .tributors cache, indexed by email, orcid and name"""
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        if not isinstance(cache, TributorsCache):
+            cache = TributorsCache(cache)
+        self._cache = cache
+
     @property
     def repo(self):
         """after some initial parsing, we can retrieve the name of the GitHub repo"""
@@ -106,6 +137,17 @@ class ParserBase:
             self.filename = filename
         return self.data
 
+    def get_contributors(self, field):
+        """Get the list of contributors (e.g., creators) in the loaded data as
+        a list indexed by the keys of the parser, so finding a contributor
+        by a key doesn't need a scan.
+        """
+        entries = self.data.get(field)
+        if not isinstance(entries, ContributorList):
+            entries = ContributorList(entries or [], keys=self.keys)
+            self.data[field] = entries
+        return entries
+
     def include_contributor(self, login):
         """Given a threshold (and preference to not include bots) return a boolean
         to indicate including the contributor or not
@@ -134,34 +176,143 @@ class ParserBase:
         """A shared function to run additional parsing on the cache, such
         as adding an orcid id when an email is defined.
         """
-        interactive = self.params.get("--interactive", False)
-
         # If the parser can be used as a resource, use it to update .tributors
         if hasattr(self, "update_lookup") and update_lookup:
             self.update_lookup()
 
-        # Then add an Orcid lookup
-        for login, entry in self.cache.items():
-            try:
-                # If we have an email, and orcid isn't defined
-                if "orcid" not in entry:
-                    orcid = get_orcid(
-                        entry.get("email"), entry.get("name"), interactive=interactive
-                    )
-                    if orcid:
-                        entry["orcid"] = orcid
-                        cli = OrcidIdentifier(orcid)
-
-                        # If we found the record, update metadata
-                        if (
-                            cli.found
-                            and not entry.get("name")
-                            or entry.get("name") == login
-                        ):
-                            entry["name"] = "%s %s" % (cli.firstName, cli.lastName)
-                        if cli.affiliation and not entry.get("affiliation"):
-                            entry["affiliation"] = cli.affiliation
-
-                self.cache[login] = entry
-            except StopIteration:
-                break
+        # Searches and decisions are saved once, when all are done
+        try:
+            self.resolve_orcids()
+        finally:
+            save_caches()
+
+    def resolve_orcids(self):
+        """Find orcid ids (and records) for cache entries that don't have
+        them, or have ids marked for refresh.
+        """
+        # A review resolves what it can without prompts first
+        review = self.params.get("--review", False)
+        interactive = self.params.get("--interactive", False) and not review
+        speculative = self.params.get("--speculative", False)
+
+        # People resolved for another repository don't need a search
+        logins = [
+            x
+            for x, entry in self.cache.items()
+            if needs_update(entry, "orcid", "orcid")
+        ]
+        self.cache.recall(logins)
+
+        # Search for emails in batches, so most single searches are cached
+        logins = [
+            x
+            for x, entry in self.cache.items()
+            if needs_update(entry, "orcid", "orcid")
+        ]
+        prefetch_emails([self.cache[x].get("email") for x in logins])
+
+        # Without prompts, resolve orcid ids (and records) in parallel first.
+        # With prompts, the searches are run in the background ahead of them.
+        workers = int(self.params.get("--workers", DEFAULT_WORKERS))
+        resolved = {}
+        prefetch = None
+        if not interactive:
+            results = parallel_map(
+                lambda login: resolve_orcid(
+                    self.cache[login], speculative=speculative, login=login
+                ),
+                logins,
+                workers=workers,
+            )
+            resolved = dict(zip(logins, results))
+        else:
+            prefetch = prefetch_candidates(
+                [
+                    (self.cache[x].get("email"), self.cache[x].get("name"), x)
+                    for x in logins
+                ],
+                workers=workers,
+            )
+
+        try:
+            # Then add an Orcid lookup
+            for login, entry in self.cache.items():
+                try:
+                    # If we have an email, and orcid isn't defined (or is stale)
+                    orcid = cli = None
+                    if needs_update(entry, "orcid", "orcid"):
+                        if login in resolved:
+                            orcid, cli = resolved[login]
+                        else:
+                            orcid, cli = resolve_orcid(entry, interactive, login=login)
+                        stale = revalidate(entry, "orcid", orcid, "orcid", remove=False)
+                        if orcid and not stale and "orcid" not in entry:
+                            set_field(entry, "orcid", orcid, "orcid")
+
+                    # An affiliation marked for refresh uses the orcid we have
+                    elif is_stale(entry, "affiliation", "orcid"):
+                        cli = get_identifier(entry["orcid"])
+
+                    if cli:
+                        update_from_identifier(entry, login, cli)
+
+                    self.cache[login] = entry
+                except StopIteration:
+                    break
+        finally:
+            if prefetch:
+                prefetch.shutdown(wait=False, cancel_futures=True)
+                candidates.forget()
+
+        # People with more than one candidate are reviewed together
+        if review:
+            logins = [
+                x for x in logins if needs_update(self.cache[x], "orcid", "orcid")
+            ]
+            people = [
+                (self.cache[x].get("email"), self.cache[x].get("name"), x)
+                for x in logins
+            ]
+            for login, orcid in zip(logins, review_orcids(people, workers)):
+                if orcid:
+                    entry = self.cache[login]
+                    set_field(entry, "orcid", orcid, "orcid")
+                    update_from_identifier(entry, login, get_identifier(orcid))
+
+
+def resolve_orcid(entry, interactive=False, speculative=False, login=None):
+    """Given a cache entry (for a login), search for an orcid id (by email or
+    name) and retrieve the record for it. Returns the orcid id and identifier.
+    """
+    orcid = get_orcid(
+        entry.get("email"),
+        entry.get("name"),
+        interactive=interactive,
+        speculative=speculative,
+        person=login,
+    )
+    if not orcid:
+        return None, None
+    return orcid, get_identifier(orcid)
+
+
+def update_from_identifier(entry, login, cli):
+    """Update the name and affiliation of a cache entry from an orcid record"""
+    # If we found the record, update metadata
+    if cli.found:
+        name = "%s %s" % (cli.firstName, cli.lastName)
+        stale = revalidate(entry, "name", name, "orcid", remove=False)
+        if not stale and (not entry.get("name") or entry.get("name") == login):
+            set_field(entry, "name", name, "orcid")
+    affiliation = cli.affiliation
+    stale = revalidate(entry, "affiliation", affiliation, "orcid", remove=False)
+    if affiliation and not stale and not entry.get("affiliation"):
+        set_field(entry, "affiliation", affiliation, "orcid")
+    return entry
+
+
+def get_identifier(orcid):
+    """Get an orcid identifier with the record already retrieved"""
+    cli = OrcidIdentifier(orcid)
+    cli.get_record()
+    return cli
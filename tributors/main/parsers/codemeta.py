@@ -11,20 +11,29 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import logging
 
 from tributors.utils.file import write_json
+from tributors.main.cache import needs_update, set_field
+from tributors.main.contributor import Contributor
 from .base import ParserBase
 
 bot = logging.getLogger("  codemeta")
 
 
+def get_orcid(entry):
+    """Orcid is represented as a full URL (the @id) but we just want the id"""
+    if "@id" in entry:
+        return entry["@id"].split("/")[-1]
+
+
 class CodeMetaParser(ParserBase):
     name = "codemeta"
+    keys = {"email": "email", "orcid": get_orcid}
 
     def __init__(self, filename=None, repo=None, params=None, **kwargs):
         filename = filename or "codemeta.json"
         self.data = {}
         super().__init__(filename, repo, params)
 
-    def init(self, force=False):
+    def init(self, force=False, from_resources=None, save=True):
         """Codemeta already has many good generators."""
         print(
             "Codemeta provides several tools to generate this for you: https://codemeta.github.io/tools/"
@@ -44,7 +53,7 @@ class CodeMetaParser(ParserBase):
         bot.info("Updating %s" % self.filename)
 
         # Read in contributors, and update cache (also runs update_lookup)
-        self.lookup = self.data.get("contributor", [])
+        self.lookup = self.get_contributors("contributor")
         self.update_cache()
 
         # Get fields from repo
@@ -90,51 +99,27 @@ class CodeMetaParser(ParserBase):
             if not self.include_contributor(login):
                 continue
 
-            cache = self.cache.get(login) or {}
-            email = cache.get("email")
-            orcid = cache.get("orcid")
+            person = Contributor.from_cache(login, self.cache.get(login) or {})
+            email, orcid = person.email, person.orcid
 
             # We can only add completely new entries that don't already exist
             if (email != None or orcid != None) and (
                 email not in self.email_lookup and orcid not in self.orcid_lookup
             ):
                 bot.info(f"   Updating {login}")
-                parts = (cache.get("name") or login).split(" ")
-                entry = {"@type": "Person", "givenName": parts[0]}
-
-                # Add the last name if it's defined
-                if len(parts) > 1:
-                    entry["familyName"] = " ".join(parts[1:])
-
-                if email != None:
-                    entry["email"] = email
-                if orcid != None:
-                    entry["@id"] = "https://orcid.org/%s" % orcid
-                self.lookup.append(entry)
+                self.lookup.append(person.to_codemeta())
 
     @property
     def email_lookup(self):
         """Return loaded metadata as an email lookup"""
-        if not hasattr(self, "_email_lookup"):
-            self._email_lookup = {}
-            self.load_data()
-        for entry in self.data.get("contributor", []):
-            if "email" in entry:
-                self._email_lookup[entry["email"]] = entry
-        return self._email_lookup
+        self.load_data()
+        return self.get_contributors("contributor").lookup("email")
 
     @property
     def orcid_lookup(self):
         """Return loaded metadata as an orcid lookup"""
-        if not hasattr(self, "_orcid_lookup"):
-            self._orcid_lookup = {}
-            self.load_data()
-            for entry in self.data.get("contributor", []):
-                if "@id" in entry:
-                    # Orcid represented as full URL but we just want id
-                    orcid = entry["@id"].split("/")[-1]
-                    self._orcid_lookup[orcid] = entry
-        return self._orcid_lookup
+        self.load_data()
+        return self.get_contributors("contributor").lookup("orcid")
 
     def update_lookup(self):
         """We can only keep track of users here based on email addresses or
@@ -172,17 +157,18 @@ class CodeMetaParser(ParserBase):
                 if (
                     "givenName" in entry
                     and "familyName" in entry
-                    and "name" not in cache
+                    and needs_update(cache, "name", self.name)
                 ):
-                    cache["name"] = "%s %s" % (entry["givenName"], entry["familyName"])
+                    name = "%s %s" % (entry["givenName"], entry["familyName"])
+                    set_field(cache, "name", name, self.name)
                     bot.info(f"   Updating {login} with name: {cache['name']}")
 
                 # Update the email
-                if "email" in entry and "emali" not in cache:
-                    cache["email"] = entry["email"]
+                if "email" in entry and needs_update(cache, "email", self.name):
+                    set_field(cache, "email", entry["email"], self.name)
                     bot.info(f"   Updating {login} with email: {cache['email']}")
 
                 # Update the orcid id
-                if "@id" in entry and "orcid" not in cache:
-                    cache["orcid"] = entry["@id"].split("/")[-1]
+                if "@id" in entry and needs_update(cache, "orcid", self.name):
+                    set_field(cache, "orcid", entry["@id"].split("/")[-1], self.name)
                     bot.info(f"   Updating {login} with orcid: {cache['orcid']}")
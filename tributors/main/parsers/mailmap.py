@@ -13,6 +13,7 @@ import os
 import sys
 
 from tributors.utils.file import read_file
+from tributors.main.cache import needs_update, set_field
 from .base import ParserBase
 
 bot = logging.getLogger("   mailmap")
@@ -76,6 +77,7 @@ class MailmapParser(ParserBase):
         for login, cache in self.cache.items():
             email = cache.get("email")
             if email in self.email_lookup:
-                if "name" not in cache:
-                    cache["name"] = self.email_lookup[email]["name"]
+                if needs_update(cache, "name", self.name):
+                    name = self.email_lookup[email]["name"]
+                    set_field(cache, "name", name, self.name)
                     bot.info(f"   Updating {login} with name: {cache['name']}")
@@ -9,19 +9,30 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import logging
-import requests
 import os
 import sys
 
+from tributors.main import http
+from tributors.main.cache import is_stale, set_field
+from tributors.main.contributor import Contributor
 from tributors.utils.file import write_json
 from .base import ParserBase
-from tributors.main.orcid import get_orcid
+from tributors.main.orcid import (
+    candidates,
+    get_orcid,
+    prefetch_candidates,
+    prefetch_emails,
+    review_orcids,
+    save_caches,
+)
+from tributors.utils.threads import parallel_map, DEFAULT_WORKERS
 
 bot = logging.getLogger("    zenodo")
 
 
 class ZenodoParser(ParserBase):
     name = "zenodo"
+    keys = {"email": "email", "orcid": "orcid", "name": "name"}
 
     def __init__(self, filename=None, repo=None, params=None, **kwargs):
         filename = filename or ".zenodo.json"
@@ -35,13 +46,13 @@ class ZenodoParser(ParserBase):
     def email_lookup(self):
         """Return loaded metadata as an email lookup."""
         self.load_data()
-        return {x["email"]: x for x in self.data.get("creators", []) if "email" in x}
+        return self.get_contributors("creators").lookup("email")
 
     @property
     def orcid_lookup(self):
         """Return loaded metadata as an orcid lookup."""
         self.load_data()
-        return {x["orcid"]: x for x in self.data.get("creators", []) if "orcid" in x}
+        return self.get_contributors("creators").lookup("orcid")
 
     def init(self, force=False, from_resources=None, save=True):
         """Generate an empty .zenodo.json if it doesn't exist"""
@@ -61,6 +72,7 @@ class ZenodoParser(ParserBase):
         if doi:
             record = get_zenodo_record(doi)
             self.data["creators"] = record["metadata"].get("creators", [])
+        self.get_contributors("creators")
 
         self.update_cache(update_lookup=False)
 
@@ -90,93 +102,120 @@ class ZenodoParser(ParserBase):
 
     def update_from_orcids(self, orcids):
         """Given a list of orcids, update the contributor file from it"""
-        lookup = {x["orcid"]: x for _, x in self.cache.items() if "orcid" in x}
+        creators = self.get_contributors("creators")
         for orcid in orcids:
             if orcid in self.orcid_lookup:
                 continue
             entry = {"orcid": orcid}
-            if orcid in lookup:
-                for field in ["name", "affiliation", "orcid"]:
-                    if field in lookup[orcid] and field not in entry:
-                        entry[field] = lookup[orcid][field]
-            if entry and entry not in self.data["creators"]:
-                self.data["creators"].append(entry)
-        return self.data["creators"]
+            cache = self.cache.get_by("orcid", orcid, {})
+            for field in ["name", "affiliation", "orcid"]:
+                if field in cache and field not in entry:
+                    entry[field] = cache[field]
+            if entry and entry not in creators:
+                creators.append(entry)
+        return creators
 
     def update_orcids(self):
         """Zenodo is a special case that has emails and real usernames, so we
         can parse through the existing file and look for orcid identifiers
         """
-        interactive = self.params.get("--interactive", False)
-        creators = []
-        for user in self.data.get("creators", []):
-            orcid = user.get("orcid")
-            name = user.get("name")
-            email = user.get("email")
-            if orcid is not None:
-                creators.append(user)
-                continue
-            if email or name:
-                orcid = get_orcid(
-                    email=email, name=name.strip(), interactive=interactive
-                )
+        review = self.params.get("--review", False)
+        interactive = self.params.get("--interactive", False) and not review
+        speculative = self.params.get("--speculative", False)
+
+        # Without prompts, creators are resolved in parallel. With prompts,
+        # the searches are run in the background ahead of them.
+        people = [
+            (user, user.get("email"), (user.get("name") or "").strip() or None)
+            for user in self.data.get("creators", [])
+            if user.get("orcid") is None and (user.get("email") or user.get("name"))
+        ]
+        prefetch_emails([email for _, email, _ in people])
+        workers = int(self.params.get("--workers", DEFAULT_WORKERS))
+        prefetch = None
+        if interactive:
+            prefetch = prefetch_candidates(
+                [(email, name, None) for _, email, name in people], workers=workers
+            )
+        try:
+            orcids = parallel_map(
+                lambda person: get_orcid(
+                    email=person[1],
+                    name=person[2],
+                    interactive=interactive,
+                    speculative=speculative,
+                ),
+                people,
+                workers=1 if interactive else workers,
+            )
+        finally:
+            if prefetch:
+                prefetch.shutdown(wait=False, cancel_futures=True)
+                candidates.forget()
+            save_caches()
+        creators = self.get_contributors("creators")
+        for (user, _, _), orcid in zip(people, orcids):
+            if orcid:
+                user["orcid"] = orcid
+                creators.reindex(user)
+
+        # Creators with more than one candidate are reviewed together
+        if review:
+            people = [x for x, orcid in zip(people, orcids) if not orcid]
+            orcids = review_orcids(
+                [(email, name, None) for _, email, name in people], workers
+            )
+            for (user, _, _), orcid in zip(people, orcids):
                 if orcid:
                     user["orcid"] = orcid
-            creators.append(user)
-        self.data["creators"] = creators
+                    creators.reindex(user)
 
     def update_from_emails(self, emails):
         """Given a list of emails, update the contributor file from it. We also
         look for new orcid ids for emails that don't have them.
         """
-        # First loop through emails in the cache
-        lookup = {x["email"]: x for _, x in self.cache.items() if "email" in x}
+        creators = self.get_contributors("creators")
+
+        # First look for the emails in the cache
         for email in emails:
             if email in self.email_lookup:
                 continue
             entry = {}
+            cache = self.cache.get_by("email", email, {})
             for field in ["name", "affiliation", "orcid"]:
-                if email in lookup and field in lookup[email]:
-                    entry[field] = lookup[email][field]
-            if entry and entry not in self.data["creators"]:
-                self.data["creators"].append(entry)
-        return self.data["creators"]
+                if field in cache:
+                    entry[field] = cache[field]
+            if entry and entry not in creators:
+                creators.append(entry)
+        return creators
 
     def update_from_logins(self, logins):
         """Given a list of logins, update the zenodo.json from it. We only
         do this on init when we haven't added /updated logins with
         people's actual names.
         """
+        creators = self.get_contributors("creators")
+
         # GitHub contributors are the source of truth
         for login in logins:
             # Check against contribution threshold, and not bot
             if not self.include_contributor(login):
                 continue
 
-            cache = self.cache.get(login) or {}
-            orcid = cache.get("orcid")
-            email = cache.get("email")
+            person = Contributor.from_cache(login, self.cache.get(login) or {})
 
             # Make sure we don't have already
-            if (orcid and orcid in self.orcid_lookup) or (
-                email and email in self.email_lookup
+            if (person.orcid and person.orcid in self.orcid_lookup) or (
+                person.email and person.email in self.email_lookup
             ):
                 continue
 
-            entry = {"name": cache.get("name") or login}
-            if login in self.cache:
-                for field in ["name", "affiliation", "orcid"]:
-                    if field in self.cache[login]:
-                        entry[field] = self.cache[login][field]
-            if "orcid" in cache and "orcid" not in entry:
-                entry["orcid"] = cache["orcid"]
-            if "affiliation" in cache and "affiliation" not in entry:
-                entry["affilitation"] = cache["affiliation"]
+            entry = person.to_zenodo()
 
             # Don't add duplicates
-            if entry not in self.data["creators"]:
-                self.data["creators"].append(entry)
-        return self.data["creators"]
+            if entry not in creators:
+                creators.append(entry)
+        return creators
 
     def update(self, thresh=1, from_resources=None, save=True):
         """Given an existing .zenodo.json file, update it with contributors
@@ -219,8 +258,10 @@ class ZenodoParser(ParserBase):
             orcid = cached.get("orcid")
             if orcid in lookup:
                 for field in ["name", "affiliation"]:
-                    if lookup[orcid].get(field) and not cached.get(field):
-                        cached[field] = lookup[orcid][field]
+                    if lookup[orcid].get(field) and (
+                        not cached.get(field) or is_stale(cached, field, self.name)
+                    ):
+                        set_field(cached, field, lookup[orcid][field], self.name)
                         bot.info(f"   Updating {login} with {field}: {cached[field]}")
 
 
@@ -228,14 +269,9 @@ def get_zenodo_record(doi):
     """Given a doi, retrieve a record using the Zenodo API"""
     # Get the record number from the doi
     record = doi.split("/")[-1].replace("zenodo.", "")
-    token = os.environ.get("ZENODO_TOKEN")
-    if token:
-        response = requests.get(
-            "https://zenodo.org/api/records/%s" % record,
-            json={"access_token": token},
-        )
-    else:
-        response = requests.get("https://zenodo.org/api/records/%s" % record)
+
+    # The shared transport adds the ZENODO_TOKEN, if exported
+    response = http.get("https://zenodo.org/api/records/%s" % record)
 
     # Successful query!
     if response.status_code != 200:
@@ -0,0 +1,384 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from tributors.main.cache import merge_entries, normalize_name
+from tributors.utils.file import get_cache_dir, read_json, write_json
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+bot = logging.getLogger("tributors.store")
+
+# Default file for the .tributors cache
+DEFAULT_CACHE_FILE = ".tributors"
+
+# Cache files with these extensions are SQLite databases
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# The identity store shared by the repositories of a user
+IDENTITY_CACHE_FILE = "identities.db"
+
+
+def get_store(filename=None):
+    """Get a store for a cache file, a SQLite database if the extension is
+    one of SQLITE_EXTENSIONS, and otherwise (the default) a json file.
+    """
+    filename = filename or DEFAULT_CACHE_FILE
+    if filename.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteStore(filename)
+    return JsonStore(filename)
+
+
+class CacheStore:
+    """A cache store loads and saves the .tributors cache, a lookup of
+    GitHub logins to entries with identifiers (email, orcid, name, etc.)
+    Stores can also import or export the cache as json. Entries are found
+    by the indexes of the loaded cache (see TributorsCache).
+    """
+
+    name = "base"
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __str__(self):
+        return "[%s-store][%s]" % (self.name, self.filename)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def load(self):
+        """Load the cache, a dictionary of entries by login"""
+        raise NotImplementedError
+
+    def save(self, cache, changed=None):
+        """Save the cache. If we know the logins that changed since it was
+        loaded (or saved) a store can use them to do less work.
+        """
+        raise NotImplementedError
+
+    def export_json(self, filename):
+        """Write the cache to a json file (the .tributors format)"""
+        write_json(self.load(), filename)
+
+    def import_json(self, filename):
+        """Add (or replace) entries from a json file to the cache"""
+        cache = self.load()
+        cache.update(read_json(filename))
+        self.save(cache)
+        return cache
+
+
+class JsonStore(CacheStore):
+    """The default store, the cache as one json file"""
+
+    name = "json"
+
+    def load(self):
+        if not self.exists():
+            return {}
+        return read_json(self.filename)
+
+    def save(self, cache, changed=None):
+        if changed is not None and not changed and self.exists():
+            return
+        bot.debug(f"Saving cache to {self.filename}")
+        write_json(cache, self.filename)
+
+
+class SqliteStore(CacheStore):
+    """A SQLite store keeps each entry as a row, keyed by login (with the
+    email and orcid indexed, for the identity store). A save only writes
+    the entries that changed since the cache was loaded (or last saved),
+    in one transaction, and if we know which logins changed we only look
+    at those.
+    """
+
+    name = "sqlite"
+
+    # Seconds to wait for another process to release a lock on the database
+    timeout = 5.0
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.saved = {}
+
+    def connect(self):
+        """Connect to the database, creating the table and indexes if needed.
+        We connect for each operation so a store can be used from any thread.
+        """
+        connection = sqlite3.connect(self.filename, timeout=self.timeout)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS contributors (
+                login TEXT PRIMARY KEY,
+                email TEXT,
+                orcid TEXT,
+                name TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS contributors_email ON contributors (email);
+            CREATE INDEX IF NOT EXISTS contributors_orcid ON contributors (orcid);
+            """)
+        return connection
+
+    def load(self):
+        if not self.exists():
+            self.saved = {}
+            return {}
+        connection = self.connect()
+        try:
+            rows = connection.execute(
+                "SELECT login, data FROM contributors ORDER BY rowid"
+            ).fetchall()
+        finally:
+            connection.close()
+        self.saved = {login: data for login, data in rows}
+        return {login: json.loads(data) for login, data in rows}
+
+    def save(self, cache, changed=None):
+        logins = cache if changed is None else [x for x in changed if x in cache]
+        rows = {login: json.dumps(cache[login], sort_keys=True) for login in logins}
+        updated = [
+            (
+                login,
+                cache[login].get("email"),
+                cache[login].get("orcid"),
+                normalize_name(cache[login].get("name")),
+                data,
+            )
+            for login, data in rows.items()
+            if self.saved.get(login) != data
+        ]
+        removed = [
+            (login,)
+            for login in (self.saved if changed is None else changed)
+            if login not in cache and login in self.saved
+        ]
+        if not updated and not removed and self.exists():
+            return
+
+        bot.debug(
+            f"Saving {len(updated)} changed and {len(removed)} removed entries to {self.filename}"
+        )
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO contributors (login, email, orcid, name, data) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (login) DO UPDATE SET "
+                    "email = excluded.email, orcid = excluded.orcid, "
+                    "name = excluded.name, data = excluded.data",
+                    updated,
+                )
+                connection.executemany(
+                    "DELETE FROM contributors WHERE login = ?", removed
+                )
+        finally:
+            connection.close()
+        self.saved.update(rows)
+        for (login,) in removed:
+            del self.saved[login]
+
+
+class IdentityStore(SqliteStore):
+    """The identity store is a SQLite database in the user cache directory,
+    shared by all the repositories (and processes) of a user, so a person
+    resolved in one repository is known in the next. It is read through
+    for entries a .tributors cache doesn't have (or is missing fields of)
+    and entries are merged back to it when a cache is saved. A merge is
+    one transaction that takes the write lock before reading, so two
+    processes saving at once don't lose each other's changes.
+    """
+
+    name = "identity"
+    timeout = 60.0
+
+    def __init__(self, filename=None):
+        super().__init__(filename or os.path.join(get_cache_dir(), IDENTITY_CACHE_FILE))
+
+    def recall(self, people):
+        """Get the shared entries for people, each a (login, email, orcid)
+        found by login, and otherwise by a (unique) email or orcid. Returns
+        the entries found by login, using one connection for all of them.
+        """
+        if not self.exists():
+            return {}
+        found = {}
+        connection = self.connect()
+        try:
+            for login, email, orcid in people:
+                for field, value in [
+                    ("login", login),
+                    ("email", email),
+                    ("orcid", orcid),
+                ]:
+                    if not value:
+                        continue
+                    rows = connection.execute(
+                        f"SELECT data FROM contributors WHERE {field} = ? LIMIT 2",
+                        (value,),
+                    ).fetchall()
+                    if len(rows) == 1:
+                        found[login] = json.loads(rows[0][0])
+                        break
+        finally:
+            connection.close()
+        return found
+
+    def merge(self, cache, logins=None):
+        """Merge entries of a cache (all, or for logins) into the store,
+        keeping the most recently updated value of each field. Returns the
+        number of entries that were added or changed. Fields removed from
+        an entry in the cache are removed (with a tombstone) unless a newer
+        value is known.
+        """
+        logins = [x for x in (cache if logins is None else logins) if x in cache]
+        if not logins:
+            return 0
+        connection = self.connect()
+        connection.isolation_level = None
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            updated = []
+            for login in logins:
+                row = connection.execute(
+                    "SELECT data FROM contributors WHERE login = ?", (login,)
+                ).fetchone()
+                old = json.loads(row[0]) if row else {}
+                entry = merge_entries(
+                    old, cache[login], getattr(cache, "removed", {}).get(login)
+                )
+                if row and entry == old:
+                    continue
+                updated.append(
+                    (
+                        login,
+                        entry.get("email"),
+                        entry.get("orcid"),
+                        normalize_name(entry.get("name")),
+                        json.dumps(entry, sort_keys=True),
+                    )
+                )
+            connection.executemany(
+                "INSERT INTO contributors (login, email, orcid, name, data) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (login) DO UPDATE SET "
+                "email = excluded.email, orcid = excluded.orcid, "
+                "name = excluded.name, data = excluded.data",
+                updated,
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        bot.debug(f"Merged {len(updated)} entries into {self.filename}")
+        return len(updated)
+
+
+class Journal:
+    """A journal is a file next to the cache where each change to the cache
+    is appended (as a line of json) as it happens. If a run is interrupted
+    before the cache is saved, the changes are replayed when the cache is
+    next loaded, and a save clears the journal. The first line of the
+    journal records the state (modification time and size) of the cache
+    file (source) the changes were made to, and if the cache file has
+    changed since (e.g., it was updated by a pull) the journal is discarded.
+    """
+
+    def __init__(self, filename, source=None):
+        self.filename = filename
+        self.source = source
+        self.lock = threading.Lock()
+        self.handle = None
+
+    def __str__(self):
+        return "[journal][%s]" % self.filename
+
+    def __repr__(self):
+        return self.__str__()
+
+    def append(self, change):
+        """Append a change, and flush it to the file"""
+        line = json.dumps(change, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.handle is None:
+                self.handle = open(self.filename, "a", encoding="utf8")
+                if not self.handle.tell():
+                    header = {"source": self.stamp()}
+                    self.handle.write(json.dumps(header) + "\n")
+            self.handle.write(line)
+            self.handle.flush()
+
+    def stamp(self):
+        """The modification time and size of the cache file, if it exists"""
+        if not self.source or not os.path.exists(self.source):
+            return None
+        stat = os.stat(self.source)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def replay(self, cache):
+        """Apply the changes in the journal to a cache, and return how many
+        there were. A partial last line (from a crash) is ignored, and a
+        journal for another state of the cache file is discarded.
+        """
+        if not os.path.exists(self.filename):
+            return 0
+        count = 0
+        with open(self.filename, "r", encoding="utf8") as filey:
+            try:
+                header = json.loads(filey.readline())
+            except ValueError:
+                header = {}
+            if "source" not in header or header["source"] != self.stamp():
+                bot.warning(f"{self.filename} is not for the current cache, removing")
+                filey.close()
+                self.clear()
+                return 0
+            for line in filey:
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    continue
+                apply_change(cache, change)
+                count += 1
+        return count
+
+    def clear(self):
+        """Remove the journal, e.g., after the cache is saved"""
+        with self.lock:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+
+def apply_change(cache, change):
+    """Apply a change from the journal to a cache. A change replaces an entry
+    (entry), removes it (deleted) or sets or removes one field of it.
+    """
+    login = change["login"]
+    if "field" in change:
+        entry = cache.setdefault(login, {})
+        if change.get("deleted"):
+            entry.pop(change["field"], None)
+        else:
+            entry[change["field"]] = change["value"]
+    elif change.get("deleted"):
+        cache.pop(login, None)
+    else:
+        cache[login] = change["entry"]
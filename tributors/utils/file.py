@@ -10,23 +10,55 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import json
 import os
+import shutil
 import tempfile
+import uuid
 
 
-def write_json(json_obj, filename, pretty=True):
-    """write_json will write a json object to file, pretty printed
+def write_json(json_obj, filename, pretty=True, mode=None):
+    """write_json will write a json object to file, pretty printed. If the
+    file already has the same content it is not written again, and otherwise
+    we write a temporary file and rename it, so the file is never partial.
 
     Arguments:
      - json_obj (dict) : the dict to print to json
      - filename (str)  : the output file to write to
+     - mode (int) : the permissions of the file (default is the umask)
     """
     kw = dict(indent=4, separators=(",", ": ")) if pretty else {}
-    with open(filename, "w", encoding="utf8") as filey:
-        dump = json.dumps(json_obj, ensure_ascii=False, **kw)
-        if pretty and not dump.endswith(os.linesep):
-            # Add newline as it is typically desired
-            dump += os.linesep
-        filey.write(dump)
+    dump = json.dumps(json_obj, ensure_ascii=False, **kw)
+    if pretty and not dump.endswith(os.linesep):
+        # Add newline as it is typically desired
+        dump += os.linesep
+
+    if os.path.exists(filename):
+        with open(filename, "r", encoding="utf8") as filey:
+            if filey.read() == dump:
+                return filename
+    return write_atomic(filename, dump, mode)
+
+
+def write_atomic(filename, content, mode=None):
+    """Write content to a temporary file next to filename, and rename it to
+    filename. With a mode the file is given those permissions, and otherwise
+    an existing file keeps its permissions, and a new file has the default
+    permissions (given the umask).
+    """
+    tmp_file = os.path.join(
+        os.path.dirname(os.path.abspath(filename)),
+        ".%s.%s.tmp" % (os.path.basename(filename), uuid.uuid4().hex),
+    )
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode or 0o666)
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as filey:
+            filey.write(content)
+        if mode is None and os.path.exists(filename):
+            shutil.copymode(filename, tmp_file)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
     return filename
 
 
@@ -76,3 +108,22 @@ def get_tmpfile(prefix="tributors-"):
     fd, tmp_file = tempfile.mkstemp(prefix=prefix)
     os.close(fd)
     return tmp_file
+
+
+def get_cache_dir(*subfolders):
+    """Get (and create if needed) the user cache directory for tributors.
+    We honor TRIBUTORS_CACHE_DIR, and then XDG_CACHE_HOME, and fall back
+    to ~/.cache/tributors.
+
+    Arguments:
+     - subfolders (str) : one or more subfolders to add to the path
+    """
+    cache_dir = os.environ.get("TRIBUTORS_CACHE_DIR")
+    if not cache_dir:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(cache_home, "tributors")
+    cache_dir = os.path.join(cache_dir, *subfolders)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -10,6 +10,7 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import re
+import sys
 
 
 def choice_prompt(prompt, choices, choice_prefix=None, multiple=False):
@@ -58,3 +59,202 @@ def entry_prompt(prompt, regex=None):
             entry = None
             message = r"Please enter a valid response. Should match regex {regex!r}"
     return entry
+
+
+def review_prompt(items, regex=None):
+    """Review a list of items at once in a full screen terminal view, and
+    return a decision for each item. Without a terminal (or curses) we ask
+    about each item in turn instead.
+
+    Parameters
+    ==========
+    items: a list of dict, each with a "title" and a list of "options"
+           (strings that can span more than one line)
+    regex: a regular expression to match an entered value
+
+    Each decision is None (not decided) or a tuple of ("choose", index),
+    ("skip", None) or ("enter", value).
+    """
+    try:
+        import curses
+    except ImportError:
+        curses = None
+
+    if curses is None or not sys.stdin.isatty() or not sys.stdout.isatty():
+        decisions = [None] * len(items)
+        for idx, item in enumerate(items):
+            decision = review_item(item, regex)
+            if decision == "quit":
+                break
+            decisions[idx] = decision
+        return decisions
+    return curses.wrapper(review_screen, items, regex)
+
+
+def review_item(item, regex=None):
+    """Ask for a decision about one item (see review_prompt) with prompts,
+    returning "quit" if the user wants to stop the review.
+    """
+    print("\n\n%s\n%s" % (item["title"], "=" * 54))
+    for idx, option in enumerate(item["options"], 1):
+        print("[%s]\n%s\n" % (idx, option))
+
+    choices = [str(i) for i, _ in enumerate(item["options"], 1)]
+    prefix = "1:%s or s to skip, e to enter, u to leave undecided, q to quit" % len(
+        choices
+    )
+    choice = choice_prompt(
+        "Please enter a choice.",
+        choices=choices + ["s", "e", "u", "q"],
+        choice_prefix=prefix,
+    )
+    if choice == "q":
+        return "quit"
+    if choice == "s":
+        return ("skip", None)
+    if choice == "u":
+        return
+    if choice == "e":
+        entry = entry_prompt("Please enter a value.", regex=regex)
+        return ("enter", entry) if entry else None
+    return ("choose", int(choice) - 1)
+
+
+def review_screen(screen, items, regex=None):
+    """The curses view for review_prompt. Arrows (or j/k) move between the
+    options, and left/right (or h/l) between the items. enter (or a number)
+    chooses an option, s skips, e enters a value, u undoes a decision and
+    q finishes the review.
+    """
+    import curses
+
+    try:
+        curses.curs_set(0)
+    except curses.error:
+        pass
+
+    decisions = [None] * len(items)
+    current = option = 0
+    message = ""
+
+    def advance():
+        nonlocal current, option
+        if current < len(items) - 1:
+            current += 1
+            option = 0
+
+    while True:
+        draw_review(screen, items, decisions, current, option, message)
+        message = ""
+        options = items[current]["options"]
+        key = screen.getch()
+
+        if key in [curses.KEY_UP, ord("k")]:
+            option = max(option - 1, 0)
+        elif key in [curses.KEY_DOWN, ord("j")]:
+            option = min(option + 1, len(options) - 1)
+        elif key in [curses.KEY_LEFT, ord("h"), ord("p")]:
+            current, option = max(current - 1, 0), 0
+        elif key in [curses.KEY_RIGHT, ord("l"), ord("n")]:
+            current, option = min(current + 1, len(items) - 1), 0
+        elif key in [curses.KEY_ENTER, 10, 13, ord(" ")]:
+            decisions[current] = ("choose", option)
+            advance()
+        elif ord("1") <= key <= ord("9") and key - ord("1") < len(options):
+            decisions[current] = ("choose", key - ord("1"))
+            advance()
+        elif key == ord("s"):
+            decisions[current] = ("skip", None)
+            advance()
+        elif key == ord("u"):
+            decisions[current] = None
+        elif key == ord("e"):
+            entry = read_entry(screen, "Value (empty to cancel): ")
+            if entry and (regex is None or re.match(regex, entry)):
+                decisions[current] = ("enter", entry)
+                advance()
+            elif entry:
+                message = f"{entry} does not match {regex}"
+        elif key == ord("q"):
+            return decisions
+
+
+def draw_review(screen, items, decisions, current, option, message=""):
+    """Draw the review of the current item, scrolled to the current option"""
+    import curses
+
+    height, width = screen.getmaxyx()
+    item = items[current]
+    decision = decisions[current]
+    decided = len([x for x in decisions if x])
+
+    # Each line of the options, with the option it belongs to
+    lines = []
+    for idx, text in enumerate(item["options"]):
+        chosen = "*" if decision == ("choose", idx) else " "
+        for number, line in enumerate(text.split("\n")):
+            prefix = "%s[%s] " % (chosen, idx + 1) if number == 0 else " " * 6
+            lines.append((idx, prefix + line.strip()))
+        lines.append((idx, ""))
+
+    status = "not decided"
+    if decision and decision[0] == "choose":
+        status = "option %s" % (decision[1] + 1)
+    elif decision and decision[0] == "skip":
+        status = "skipped"
+    elif decision:
+        status = "entered %s" % decision[1]
+
+    screen.erase()
+    header = [
+        "[%s/%s] %s" % (current + 1, len(items), item["title"]),
+        "Decision: %s (%s of %s decided)" % (status, decided, len(items)),
+        "",
+    ]
+    footer = [
+        message,
+        "up/down option  left/right person  enter/1-9 choose  "
+        "s skip  e enter  u undo  q finish",
+    ]
+    available = max(height - len(header) - len(footer), 1)
+    selected = [i for i, (idx, _) in enumerate(lines) if idx == option]
+    start = max(0, (selected[0] if selected else 0) - available + 6)
+
+    def write(y, text, attr=0):
+        if 0 <= y < height:
+            try:
+                screen.addnstr(y, 0, text, max(width - 1, 0), attr)
+            except curses.error:
+                pass
+
+    for y, text in enumerate(header):
+        write(y, text, curses.A_BOLD if y == 0 else 0)
+    for y, (idx, text) in enumerate(lines[start : start + available]):
+        write(len(header) + y, text, curses.A_REVERSE if idx == option else 0)
+    for y, text in enumerate(footer):
+        write(height - len(footer) + y, text)
+    screen.refresh()
+
+
+def read_entry(screen, prompt):
+    """Read a line of text at the bottom of the screen"""
+    import curses
+
+    height, _ = screen.getmaxyx()
+    screen.move(height - 1, 0)
+    screen.clrtoeol()
+    screen.addstr(height - 1, 0, prompt)
+    curses.echo()
+    try:
+        curses.curs_set(1)
+    except curses.error:
+        pass
+    try:
+        entry = screen.getstr(height - 1, len(prompt), 64)
+    finally:
+        curses.noecho()
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+    return entry.decode("utf-8", "ignore").strip()
@@ -0,0 +1,173 @@
+"""
+
+Copyright (C) 2020-2022 Vanessa Sochat.
+
+This Source Code Form is subject to the terms of the
+Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import contextvars
+import threading
+import time
+
+# Default number of workers for network calls made in parallel
+DEFAULT_WORKERS = 4
+
+# The scope of the current call (see Scope), kept by threads started for it
+current_scope = contextvars.ContextVar("tributors_scope", default=None)
+
+
+def parallel_map(func, items, workers=1):
+    """Run a function on each item with a bounded pool of threads, and return
+    the results in the same order as the items. With a single worker (or
+    a single item) we don't start any threads.
+
+    Arguments:
+     - func (callable) : the function to run on each item
+     - items (iterable) : the items to process
+     - workers (int) : the maximum number of threads to use
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(in_context(func), items))
+
+
+def in_context(func):
+    """Wrap a function to run in (a copy of) the current context, so a thread
+    of a pool keeps the scope of the caller that submitted it.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
+
+
+class Scope:
+    """A scope collects the keys of single flights used by a call (and the
+    threads it starts). When it ends, results that no other open scope is
+    using are forgotten, so a long running process doesn't keep them, and
+    calls that overlap still share them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = set()
+
+    def __str__(self):
+        return "[scope][%s]" % len(self.keys)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def add(self, flight, key):
+        """Add a key of a flight, and return True if the scope didn't have it"""
+        with self.lock:
+            if (flight, key) in self.keys:
+                return False
+            self.keys.add((flight, key))
+            return True
+
+    def close(self):
+        """Release the keys of the scope"""
+        with self.lock:
+            keys, self.keys = self.keys, set()
+        for flight, key in keys:
+            flight.release(key)
+
+
+@contextlib.contextmanager
+def scope():
+    """Run a call in a new scope, and release its keys when it is done"""
+    new_scope = Scope()
+    token = current_scope.set(new_scope)
+    try:
+        yield new_scope
+    finally:
+        current_scope.reset(token)
+        new_scope.close()
+
+
+class SingleFlight:
+    """A single flight collapses calls for the same key into one call. The
+    first caller runs the function, concurrent callers wait for it, and
+    later callers get the stored result. If the call fails (raises an error
+    or returns None) the result is given to everyone waiting and the key is
+    forgotten so it can be tried again. With a ttl (in seconds), results are
+    also forgotten once they are older than the ttl. Results used in a scope
+    are forgotten when the last open scope using them ends.
+    """
+
+    def __init__(self, ttl=None):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.results = {}
+        self.expires = {}
+        self.holders = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Return the result for a key, running func(*args, **kwargs) only
+        if no one else has (or is currently doing so).
+        """
+        active = current_scope.get()
+        with self.lock:
+            self.expire()
+            if active is not None and active.add(self, key):
+                self.holders[key] = self.holders.get(key, 0) + 1
+            future = self.results.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.results[key] = future
+
+        if owner:
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                self.forget(key)
+                future.set_exception(e)
+            else:
+                if result is None:
+                    self.forget(key)
+                elif self.ttl is not None:
+                    with self.lock:
+                        self.expires[key] = time.time() + self.ttl
+                future.set_result(result)
+        return future.result()
+
+    def expire(self):
+        """Forget results older than the ttl (the lock must be held)"""
+        now = time.time()
+        for key in [k for k, expires in self.expires.items() if expires <= now]:
+            del self.expires[key]
+            self.results.pop(key, None)
+
+    def release(self, key):
+        """Release a key for a scope, and forget the result if no other open
+        scope is using it.
+        """
+        with self.lock:
+            count = self.holders.get(key, 0) - 1
+            if count > 0:
+                self.holders[key] = count
+                return
+            self.holders.pop(key, None)
+            self.results.pop(key, None)
+            self.expires.pop(key, None)
+
+    def forget(self, key=None):
+        """Forget a stored result, or all results if no key is provided"""
+        with self.lock:
+            if key is None:
+                self.results = {}
+                self.expires = {}
+            else:
+                self.results.pop(key, None)
+                self.expires.pop(key, None)